@@ -105,6 +105,14 @@ class RecruitApi(BaseAPIModel):
 class ClusterApi(BaseAPIModel):
     VECTORIZE = "/cluster/vectorize"
     CLUSTERING = "/cluster/clustering"
+    CLUSTERING_RESTART = "/cluster/clustering/restart"
+    CLUSTERING_SWEEP = "/cluster/clustering/sweep"
+    PREDICT = "/cluster/predict"
+    JOB_SUBMIT = "/cluster/job/submit"
+    JOB_GET = "/cluster/job/get"
+    JOB_CHART = "/cluster/job/chart"
+    JOB_RESUME = "/cluster/job/resume"
+    READY = "/cluster/ready"
 
 
 class ImageApi(BaseAPIModel):
@@ -128,6 +136,14 @@ API_PERMISSION = {
     AccountApi.DISABLE_ACCOUNT: [Role.ADMIN],
     ClusterApi.VECTORIZE: ALLOW_ALL,
     ClusterApi.CLUSTERING: ALLOW_ALL,
+    ClusterApi.CLUSTERING_RESTART: ALLOW_ALL,
+    ClusterApi.CLUSTERING_SWEEP: ALLOW_ALL,
+    ClusterApi.PREDICT: ALLOW_ALL,
+    ClusterApi.JOB_SUBMIT: ALLOW_ALL,
+    ClusterApi.JOB_GET: ALLOW_ALL,
+    ClusterApi.JOB_CHART: ALLOW_ALL,
+    ClusterApi.JOB_RESUME: ALLOW_ALL,
+    ClusterApi.READY: ALLOW_ALL,
     ClubApi.CLUB_GET: ALLOW_ALL,
     ClubApi.CLUB_CREATE: [Role.ADMIN, Role.USER],
     ClubApi.CLUB_UPDATE: [Role.ADMIN, Role.USER],
@@ -37,6 +37,23 @@ class ProjectConfig(BaseSettings):
     VISION_CONFIG_PATH = BASE_DIR + r"/resources/cclub-cloud-vision-api.json"
     STOPWORD_PATH = BASE_DIR + r"/resources/vn_stopword.txt"
     LOG_TIME_OUT = 10
+    CLUSTERING_WORKERS = int(getenv("CLUSTERING_WORKERS", os.cpu_count() or 1))
+    CLUSTERING_JOB_TTL = int(getenv("CLUSTERING_JOB_TTL", 60 * 60))
+    CLUSTERING_CHECKPOINT_DIR = getenv(
+        "CLUSTERING_CHECKPOINT_DIR", BASE_DIR + r"/checkpoint"
+    )
+    CLUSTERING_CHECKPOINT_EVERY = int(getenv("CLUSTERING_CHECKPOINT_EVERY", 5))
+    EMBEDDING_BATCH_SIZE = int(getenv("EMBEDDING_BATCH_SIZE", 32))
+    PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "False").lower() in ("true", "1", "t")
+    PHOBERT_INFERENCE_MODE = getenv("PHOBERT_INFERENCE_MODE", "fp32")
+    INFERENCE_WORKERS = int(getenv("INFERENCE_WORKERS", 1))
+    INFERENCE_QUEUE_SIZE = int(getenv("INFERENCE_QUEUE_SIZE", 8))
+    INFERENCE_TORCH_THREADS = int(getenv("INFERENCE_TORCH_THREADS", 0))
+    EMBEDDING_CACHE_BACKEND = getenv("EMBEDDING_CACHE_BACKEND", "disk")
+    EMBEDDING_CACHE_DIR = getenv("EMBEDDING_CACHE_DIR", BASE_DIR + r"/cache/embedding")
+    EMBEDDING_CACHE_SIZE = int(getenv("EMBEDDING_CACHE_SIZE", 10000))
+    EMBEDDING_CACHE_DISK_SIZE = int(getenv("EMBEDDING_CACHE_DISK_SIZE", 100000))
+    EMBEDDING_CACHE_TTL = int(getenv("EMBEDDING_CACHE_TTL", 60 * 60 * 24 * 7))
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7
 
 
@@ -33,6 +33,48 @@ class SortOrder(str, Enum):
     DESC = -1
 
 
+class JobStatus:
+    PENDING: str = "PENDING"
+    RUNNING: str = "RUNNING"
+    SUCCESS: str = "SUCCESS"
+    FAILURE: str = "FAILURE"
+
+
+class ModelStatus:
+    NOT_LOADED: str = "NOT_LOADED"
+    LOADING: str = "LOADING"
+    READY: str = "READY"
+    FAILED: str = "FAILED"
+
+
+class InferenceMode(str, Enum):
+    FP32 = "fp32"
+    INT8 = "int8"
+
+
+class ClusteringCriterion(str, Enum):
+    LOSS = "loss"
+    DAVIES_BOULDIN = "davies_bouldin"
+
+
+class ResultFormat(str, Enum):
+    JSON = "json"
+    COMPACT = "compact"
+    NPZ = "npz"
+
+
+class EmbeddingCacheBackend(str, Enum):
+    REDIS = "redis"
+    DISK = "disk"
+    NONE = "none"
+
+
+class MembershipDtype(str, Enum):
+    FLOAT32 = "float32"
+    FLOAT16 = "float16"
+    UINT8 = "uint8"
+
+
 class Queue:
     NOTIFICATION = "notification"
     SOCKET = "socket"
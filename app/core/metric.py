@@ -0,0 +1,24 @@
+import math
+from typing import Dict
+from prometheus_client import Histogram
+
+
+# exposed on /metrics by the Instrumentator in app/server.py (default registry)
+clustering_phase_seconds = Histogram(
+    "clustering_phase_seconds",
+    "Wall time of a SSMC_FCM clustering phase per run",
+    ["phase", "n_points", "n_clusters"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, math.inf),
+)
+
+
+def size_bucket(n_points: int) -> str:
+    # dataset sizes rounded up to a power of ten, keeping label cardinality low
+    return str(10 ** math.ceil(math.log10(max(n_points, 1))))
+
+
+def observe_phase_time(phase_time: Dict[str, float], n_points: int, n_clusters: int):
+    for phase, seconds in phase_time.items():
+        clustering_phase_seconds.labels(
+            phase=phase, n_points=size_bucket(n_points), n_clusters=str(n_clusters)
+        ).observe(seconds)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Any, List, Optional
 from pydantic import BaseModel
 
 
@@ -8,11 +8,52 @@ class Cluster(BaseModel):
     fields_len: List
     fields_weight: List
     dataset: List
+    aswc_sample_size: Optional[int] = None
+    seed: Optional[int] = None
+    distance_mode: Optional[str] = None
+    seeding: Optional[str] = None
+    batch_size: Optional[int] = None
+    init_centroid: Optional[List] = None
+    init_membership: Optional[List] = None
+    init_identity: Optional[List] = None
+    init_fuzzifier: Optional[List] = None
+    metric_every: Optional[int] = None
+    patience: Optional[int] = None
+    loss_tol: Optional[float] = None
+    fields_sparse: Optional[List[bool]] = None
 
 
 class ClusterResponse(Cluster):
     id: str
 
 
+class ClusterModel(BaseModel):
+    centroid: List
+    identity: Optional[List] = None
+    fuzzifier: Optional[List] = None
+    fields_len: List
+    fields_weight: List
+    norm_mode: str
+    fuzzi_M: float
+    epsilon: float
+    l2_distance: List
+    minmax_distance: List
+
+
+class ClusterPredict(BaseModel):
+    dataset: List
+    identity: Optional[List] = None
+
+
+class ClusteringJob(BaseModel):
+    id: str
+    status: str
+    client_id: Optional[str] = None
+    created_at: int
+    finished_at: Optional[int] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+
 if __name__ == "__main__":
     pass
@@ -1,18 +1,46 @@
 import asyncio
-from typing import Dict, Optional
-from fastapi import APIRouter
+import numpy as np
+from typing import Dict, Optional, Union
+from fastapi import APIRouter, Header, Query, Response, status
 
 from app.core.model import HttpResponse, success_response
 from app.core.api import ClusterApi
+from app.core.constant import (
+    ClusteringCriterion,
+    JobStatus,
+    MembershipDtype,
+    ModelStatus,
+    ResultFormat,
+)
+from app.core.exception import CustomHTTPException
+from app.service.club import ClubService
 from app.service.loader import loader
-from app.service.ssmc_fcm import SSMC_FCM
-from app.model.cluster import Cluster
+from app.model.cluster import Cluster, ClusterModel, ClusterPredict
+from app.util.fcm import predict_membership
 from app.util.model import get_dict
+from app.worker.chart import chart_worker
+from app.worker.clustering import clustering_worker
+from app.worker.inference import inference_worker
 from app.worker.socket import SocketPayload, socket_worker
 from app.util.time import get_current_timestamp
 
 router = APIRouter()
 
+NPZ_MEDIA_TYPE = "application/x-npz"
+
+
+@router.get(ClusterApi.READY, response_model=HttpResponse)
+async def ready(require_model: bool = False):
+    # the service is ready without the model (it loads on first vectorize),
+    # require_model=true only passes once PhoBERT is loaded
+    if require_model and loader.status != ModelStatus.READY:
+        raise CustomHTTPException(
+            error_type="model_not_ready",
+            message=loader.error,
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    return success_response(data={"model": loader.status, "error": loader.error})
+
 
 @router.post(ClusterApi.VECTORIZE, response_model=HttpResponse)
 async def vectorize(data: Dict, client_id: Optional[str] = None):
@@ -32,22 +60,24 @@ async def vectorize(data: Dict, client_id: Optional[str] = None):
             )
 
         if raw_data["type"] == "categorical":
-            vectors = await asyncio.create_task(
-                loader.multilabel_binarizing(
-                    raw_data=item_data, classes=raw_data["collDiffData"]
-                )
+            vectors = await inference_worker.run(
+                loader.multilabel_binarizing,
+                raw_data=item_data,
+                classes=raw_data["collDiffData"],
             )
             for idx, vector in enumerate(vectors):
                 data[headerIndex]["data"][idx]["data"] = vector.tolist()
 
         if raw_data["type"] == "numerical":
-            vectors = await loader.numerical_vectorize(raw_data=item_data)
+            vectors = await inference_worker.run(
+                loader.numerical_vectorize, raw_data=item_data
+            )
             for idx, vector in enumerate(vectors):
                 data[headerIndex]["data"][idx]["data"] = vector
 
         if raw_data["type"] == "text":
-            vectors = await asyncio.create_task(
-                loader.feature_engineering(data=item_data, client_id=client_id)
+            vectors = await inference_worker.run(
+                loader.feature_engineering, data=item_data, client_id=client_id
             )
             for idx, vector in enumerate(vectors):
                 data[headerIndex]["data"][idx]["data"] = vector.tolist()
@@ -66,14 +96,165 @@ async def vectorize(data: Dict, client_id: Optional[str] = None):
     return success_response(data=data)
 
 
+async def get_clustering_input(cluster: Cluster, warm_start_id: Optional[str] = None):
+    data = get_dict(cluster)
+    if warm_start_id:
+        warm_start = await ClubService().get_cluster_warm_start(warm_start_id)
+        data = {**warm_start, **data}
+    return data
+
+
+def get_result_format(
+    result_format: Optional[ResultFormat] = None, accept: Optional[str] = None
+) -> str:
+    # the result_format query parameter wins over the Accept header
+    if result_format:
+        return result_format.value
+    if accept and (NPZ_MEDIA_TYPE in accept or "application/octet-stream" in accept):
+        return ResultFormat.NPZ.value
+    return ResultFormat.JSON.value
+
+
+def result_response(result: Union[Dict, bytes]):
+    if isinstance(result, bytes):
+        return Response(content=result, media_type=NPZ_MEDIA_TYPE)
+    return success_response(data=result)
+
+
 @router.post(ClusterApi.CLUSTERING, response_model=HttpResponse)
-async def clustering(cluster: Cluster, client_id: Optional[str] = None):
-    ssmc_fcm = SSMC_FCM(**get_dict(cluster))
-    ssmc_fcm.clustering(client_id=client_id)
-    ssmc_fcm.show_loss_function(client_id=client_id)
+async def clustering(
+    cluster: Cluster,
+    client_id: Optional[str] = None,
+    warm_start_id: Optional[str] = None,
+    result_format: Optional[ResultFormat] = None,
+    membership_dtype: MembershipDtype = Query(MembershipDtype.FLOAT32),
+    history: Optional[bool] = None,
+    chart: bool = False,
+    accept: Optional[str] = Header(None),
+):
+    data = await get_clustering_input(cluster, warm_start_id)
+    job_id = clustering_worker.submit(
+        data,
+        client_id=client_id,
+        result_format=get_result_format(result_format, accept),
+        membership_dtype=membership_dtype.value,
+        history=history,
+        chart=chart,
+    )
+    job = await clustering_worker.wait(job_id)
+    # only the chart (by the result's chart_id) is kept past this call
+    clustering_worker.forget(job_id, keep_chart=True)
+    if job.status == JobStatus.FAILURE:
+        raise CustomHTTPException(error_type="system_error", message=job.error)
+    return result_response(job.result)
+
+
+@router.post(ClusterApi.CLUSTERING_RESTART, response_model=HttpResponse)
+async def clustering_restart(
+    cluster: Cluster,
+    n_restart: int = 4,
+    criterion: ClusteringCriterion = Query(ClusteringCriterion.LOSS),
+    client_id: Optional[str] = None,
+    result_format: Optional[ResultFormat] = None,
+    membership_dtype: MembershipDtype = Query(MembershipDtype.FLOAT32),
+    accept: Optional[str] = Header(None),
+):
+    res = await clustering_worker.restart(
+        get_dict(cluster),
+        n_restart=n_restart,
+        criterion=criterion.value,
+        client_id=client_id,
+        result_format=get_result_format(result_format, accept),
+        membership_dtype=membership_dtype.value,
+    )
+    return result_response(res)
+
+
+@router.post(ClusterApi.CLUSTERING_SWEEP, response_model=HttpResponse)
+async def clustering_sweep(
+    cluster: Cluster,
+    k_min: int = 2,
+    k_max: int = 10,
+    client_id: Optional[str] = None,
+):
+    res = await clustering_worker.sweep(
+        get_dict(cluster), k_min=k_min, k_max=k_max, client_id=client_id
+    )
+    return success_response(data=res)
+
+
+@router.post(ClusterApi.PREDICT, response_model=HttpResponse)
+async def predict(cluster_id: str, data: ClusterPredict):
+    model = ClusterModel(**await ClubService().get_cluster_model(cluster_id))
+    membership = predict_membership(
+        np.array(data.dataset, dtype=float),
+        np.array(model.centroid, dtype=float),
+        fields_len=model.fields_len,
+        fields_weight=model.fields_weight,
+        l2_distance=model.l2_distance,
+        minmax_distance=model.minmax_distance,
+        norm_mode=model.norm_mode,
+        fuzzi_M=model.fuzzi_M,
+        epsilon=model.epsilon,
+    )
     return success_response(
         data={
-            "pred_labels": ssmc_fcm.pred_labels,
-            "membership": ssmc_fcm.membership,
+            "identity": data.identity,
+            "labels": np.argmax(membership, axis=1).tolist(),
+            "membership": membership.tolist(),
         }
     )
+
+
+@router.post(ClusterApi.JOB_SUBMIT, response_model=HttpResponse)
+async def submit_clustering_job(
+    cluster: Cluster,
+    client_id: Optional[str] = None,
+    warm_start_id: Optional[str] = None,
+    result_format: Optional[ResultFormat] = None,
+    membership_dtype: MembershipDtype = Query(MembershipDtype.FLOAT32),
+    history: Optional[bool] = None,
+    chart: bool = False,
+    checkpoint: bool = False,
+):
+    # an npz job result is served as the raw file by JOB_GET once finished
+    data = await get_clustering_input(cluster, warm_start_id)
+    job_id = clustering_worker.submit(
+        data,
+        client_id=client_id,
+        result_format=get_result_format(result_format),
+        membership_dtype=membership_dtype.value,
+        history=history,
+        chart=chart,
+        checkpoint=checkpoint,
+    )
+    return success_response(data=job_id)
+
+
+@router.post(ClusterApi.JOB_RESUME, response_model=HttpResponse)
+async def resume_clustering_job(job_id: str):
+    # continues a job submitted with checkpoint=true from its last checkpoint
+    if not clustering_worker.resume(job_id):
+        raise CustomHTTPException(error_type="cluster_job_not_exist")
+    return success_response(data=job_id)
+
+
+@router.get(ClusterApi.JOB_GET, response_model=HttpResponse)
+async def get_clustering_job(job_id: str):
+    job = clustering_worker.get(job_id)
+    if not job:
+        raise CustomHTTPException(error_type="cluster_job_not_exist")
+    if isinstance(job.result, bytes):
+        return result_response(job.result)
+    return success_response(data=job)
+
+
+@router.get(ClusterApi.JOB_CHART, response_model=HttpResponse)
+async def get_clustering_job_chart(job_id: str):
+    # png of the loss / DB / ASWC series, rendered once per result; job_id is
+    # the chart_id of a job, clustering or restart result
+    metrics = clustering_worker.get_metrics(job_id)
+    if not metrics:
+        raise CustomHTTPException(error_type="cluster_job_not_exist")
+    image = await asyncio.wrap_future(chart_worker.render(job_id, metrics))
+    return Response(content=image, media_type="image/png")
@@ -22,6 +22,7 @@ from app.router.account import router as account_router
 from app.router.image import router as image_router
 
 from app.router.cluster import router as cluster_router
+from app.service.loader import loader
 from app.router.club import router as club_router
 from app.router.recruit import router as recruit_router
 from app.util.model import get_dict
@@ -46,6 +47,8 @@ instrumentator = Instrumentator(
 @app.on_event("startup")
 async def _startup():
     instrumentator.expose(app)
+    if project_config.PRELOAD_MODELS:
+        loader.preload()
     services_info()
 
 
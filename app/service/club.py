@@ -11,6 +11,7 @@ from app.model.notification import Notification, SocketNotification
 from app.model.club import *
 from app.repo.mongo import get_repo
 from app.util.model import get_dict, to_response_dto
+from app.util.npy import decode_npy
 from app.util.time import get_current_timestamp, to_datestring
 from app.util.mail import make_mail_end_form_round, Email, make_shift_mail
 from app.worker.socket import socket_worker
@@ -937,6 +938,40 @@ class ClubService:
             res.append(to_response_dto(doc_id, uv, ClusterResponse))
         return res
 
+    async def get_cluster_warm_start(self, cluster_id: str):
+        # previous centroids / memberships (and the M2 fuzzifiers of the
+        # supervised points) saved with a clustering result, a compact result's
+        # membership is decoded from its base64 .npy
+        cluster = await self.get_cluster({"_id": cluster_id})
+        if not cluster:
+            raise CustomHTTPException("cluster_not_exist")
+        model = cluster.data.get("model") or {}
+        data = {
+            "identity": model.get("identity"),
+            "fuzzifier": model.get("fuzzifier"),
+            **cluster.data,
+        }
+        if isinstance(data.get("membership"), str):
+            try:
+                data["membership"] = (
+                    decode_npy(data["membership"]) / data.get("membership_scale", 1)
+                ).tolist()
+            except Exception as e:
+                raise CustomHTTPException("cluster_warm_start_invalid", message=str(e))
+        return {
+            f"init_{key}": data.get(key)
+            for key in ("centroid", "membership", "identity", "fuzzifier")
+            if data.get(key)
+        }
+
+    async def get_cluster_model(self, cluster_id: str):
+        cluster = await self.get_cluster({"_id": cluster_id})
+        if not cluster:
+            raise CustomHTTPException("cluster_not_exist")
+        if not cluster.data.get("model"):
+            raise CustomHTTPException("cluster_model_not_exist")
+        return cluster.data["model"]
+
     async def create_cluster(self, cluster: Cluster, actor: str):
         event, _ = await self.verify_event_owner(event_id=cluster.event_id, actor=actor)
         round_check = await self.get_round({"_id": cluster.round_id})
@@ -0,0 +1,160 @@
+import os
+import hashlib
+import threading
+import time
+import traceback
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List
+
+from app.core.config import project_config
+from app.core.constant import EmbeddingCacheBackend
+
+
+class EmbeddingCache:
+    # text embeddings keyed by sha256(model id, normalized text): an in-process
+    # LRU in front of a persistent tier (redis, local .npy files or none); both
+    # persistent tiers expire entries after EMBEDDING_CACHE_TTL, the disk one
+    # also keeps at most EMBEDDING_CACHE_DISK_SIZE files
+    def __init__(
+        self,
+        backend: str = project_config.EMBEDDING_CACHE_BACKEND,
+        max_size: int = project_config.EMBEDDING_CACHE_SIZE,
+    ) -> None:
+        self.backend = EmbeddingCacheBackend(backend).value
+        self.max_size = max_size
+        self.__lru: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__disk_lock = threading.Lock()
+        self.__disk_size = None
+        self.__redis = None
+        if self.backend == EmbeddingCacheBackend.REDIS.value:
+            from app.repo.redis import redis_connection
+
+            self.__redis = redis_connection.get_connection()
+
+    @staticmethod
+    def key(text: str, model_id: str) -> str:
+        return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self.__lock:
+            for key in keys:
+                if key in self.__lru:
+                    self.__lru.move_to_end(key)
+                    found[key] = self.__lru[key]
+        missing = [key for key in keys if key not in found]
+        if missing:
+            stored = self.__load(missing)
+            self.__remember(stored)
+            found.update(stored)
+        return found
+
+    def set_many(self, embeddings: Dict[str, np.ndarray]):
+        self.__remember(embeddings)
+        self.__store(embeddings)
+
+    def __remember(self, embeddings: Dict[str, np.ndarray]):
+        with self.__lock:
+            for key, embedding in embeddings.items():
+                self.__lru[key] = embedding
+                self.__lru.move_to_end(key)
+            while len(self.__lru) > self.max_size:
+                self.__lru.popitem(last=False)
+
+    def __path(self, key: str) -> str:
+        return os.path.join(project_config.EMBEDDING_CACHE_DIR, key[:2], f"{key}.npy")
+
+    def __load(self, keys) -> Dict[str, np.ndarray]:
+        # a failing persistent tier only costs cache misses
+        try:
+            if self.backend == EmbeddingCacheBackend.REDIS.value:
+                values = self.__redis.mget([f"embedding:{key}" for key in keys])
+                return {
+                    key: np.frombuffer(value, dtype=np.float32)
+                    for key, value in zip(keys, values)
+                    if value is not None
+                }
+            if self.backend == EmbeddingCacheBackend.DISK.value:
+                return {
+                    key: np.load(self.__path(key))
+                    for key in keys
+                    if self.__touch(self.__path(key))
+                }
+        except Exception as e:
+            traceback.print_exc()
+        return {}
+
+    def __store(self, embeddings: Dict[str, np.ndarray]):
+        try:
+            if self.backend == EmbeddingCacheBackend.REDIS.value:
+                pipeline = self.__redis.pipeline()
+                for key, embedding in embeddings.items():
+                    pipeline.set(
+                        f"embedding:{key}",
+                        np.asarray(embedding, dtype=np.float32).tobytes(),
+                        ex=project_config.EMBEDDING_CACHE_TTL,
+                    )
+                pipeline.execute()
+            if self.backend == EmbeddingCacheBackend.DISK.value:
+                for key, embedding in embeddings.items():
+                    path = self.__path(key)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(f"{path}.tmp", "wb") as f:
+                        np.save(f, np.asarray(embedding, dtype=np.float32))
+                    os.replace(f"{path}.tmp", path)
+                self.__bound_disk(len(embeddings))
+        except Exception as e:
+            traceback.print_exc()
+
+    def __touch(self, path: str) -> bool:
+        # a disk hit refreshes the file's mtime, which orders evictions
+        expired_at = time.time() - project_config.EMBEDDING_CACHE_TTL
+        try:
+            if os.path.getmtime(path) < expired_at:
+                os.remove(path)
+                return False
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def __bound_disk(self, n_stored: int):
+        # the files are counted once, then the directory is only walked again
+        # when the count goes over EMBEDDING_CACHE_DISK_SIZE
+        with self.__disk_lock:
+            if self.__disk_size is not None:
+                self.__disk_size += n_stored
+                if self.__disk_size <= project_config.EMBEDDING_CACHE_DISK_SIZE:
+                    return
+            self.__disk_size = self.__prune()
+
+    def __prune(self) -> int:
+        # drop expired files, then the least recently used ones down to 90% of
+        # EMBEDDING_CACHE_DISK_SIZE so that pruning does not run on every store
+        expired_at = time.time() - project_config.EMBEDDING_CACHE_TTL
+        files = []
+        for root, _, names in os.walk(project_config.EMBEDDING_CACHE_DIR):
+            for name in names:
+                if not name.endswith(".npy"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        files.sort()
+        max_size = project_config.EMBEDDING_CACHE_DISK_SIZE
+        n_kept = len([mtime for mtime, _ in files if mtime >= expired_at])
+        if len(files) > max_size:
+            n_kept = min(n_kept, int(0.9 * max_size))
+        for _, path in files[: len(files) - n_kept]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        return n_kept
+
+
+embedding_cache = EmbeddingCache()
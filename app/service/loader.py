@@ -1,4 +1,6 @@
 import gensim
+import threading
+import traceback
 import torch
 import underthesea
 import numpy as np
@@ -12,12 +14,56 @@ from transformers import (
 from sklearn.preprocessing import MultiLabelBinarizer
 
 from app.core.config import project_config
+from app.core.constant import InferenceMode, ModelStatus
+from app.service.embedding_cache import embedding_cache
 from app.worker.socket import SocketPayload, socket_worker
 from app.util.time import get_current_timestamp
 
 
 class Loader:
-    def __init__(self) -> None:
+    # PhoBERT, its tokenizer and the stop words are loaded on first use (or in
+    # the background by preload), not when the module is imported. The int8
+    # inference mode quantizes the Linear layers dynamically on CPU
+    def __init__(
+        self, inference_mode: str = project_config.PHOBERT_INFERENCE_MODE
+    ) -> None:
+        self.__model_id = "vinai/phobert-base"
+        self.inference_mode = InferenceMode(inference_mode).value
+        self.__device = None
+        self.__phobert = None
+        self.__tokenizer = None
+        self.__stop_word_data = None
+        self.status = ModelStatus.NOT_LOADED
+        self.error = None
+        self.__lock = threading.Lock()
+
+    def load(self):
+        with self.__lock:
+            if self.status == ModelStatus.READY:
+                return
+            self.status = ModelStatus.LOADING
+            try:
+                self.__load()
+                self.status = ModelStatus.READY
+                self.error = None
+            except Exception as e:
+                traceback.print_exc()
+                self.status = ModelStatus.FAILED
+                self.error = str(e)
+                raise
+
+    def preload(self):
+        loader_thread = threading.Thread(target=self.__preload, args=())
+        loader_thread.daemon = True
+        loader_thread.start()
+
+    def __preload(self):
+        try:
+            self.load()
+        except Exception as e:
+            pass
+
+    def __load(self):
         if torch.cuda.is_available():
             self.__device = torch.device("cuda")
 
@@ -29,10 +75,16 @@ class Loader:
             self.__device = torch.device("cpu")
 
         # Load model vector hóa
-        self.__phobert = AutoModel.from_pretrained("vinai/phobert-base").to(
-            self.__device
-        )
-        self.__tokenizer = AutoTokenizer.from_pretrained("vinai/phobert-base")
+        self.__phobert = AutoModel.from_pretrained(self.__model_id).to(self.__device)
+        self.__tokenizer = AutoTokenizer.from_pretrained(self.__model_id)
+        if self.inference_mode == InferenceMode.INT8.value:
+            if self.__device.type == "cpu":
+                self.__phobert = torch.ao.quantization.quantize_dynamic(
+                    self.__phobert, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            else:
+                print("int8 inference is CPU only, using fp32 on the GPU instead.")
+                self.inference_mode = InferenceMode.FP32.value
 
         # # Load model summarization
         # self.model = T5ForConditionalGeneration.from_pretrained("NlpHUST/t5-small-vi-summarization").to(device)
@@ -42,53 +94,104 @@ class Loader:
             project_config.STOPWORD_PATH, dtype="str", delimiter="\n", encoding="utf8"
         ).tolist()
 
-    async def feature_engineering(self, data: List, client_id: str = None):
-        features_set = []
-        for line_idx, line in enumerate(data):
-            line = gensim.utils.simple_preprocess(str(line))  # Tiền xử lý dữ liệu
-            line = " ".join(line)
-            line = underthesea.word_tokenize(line, format="text")  # Segment word
-            line = " ".join(
-                [word for word in line.split() if word not in self.__stop_word_data]
+    def __preprocess(self, line) -> str:
+        line = gensim.utils.simple_preprocess(str(line))  # Tiền xử lý dữ liệu
+        line = " ".join(line)
+        line = underthesea.word_tokenize(line, format="text")  # Segment word
+        line = " ".join(
+            [word for word in line.split() if word not in self.__stop_word_data]
+        )
+        # if len(line.split()) > 100: # Summary long text
+        # self.model.eval()
+        #   tokenized_text = self.t5tokenizer.encode(line, return_tensors="pt").to(self.__device)
+        #   summary_ids = model.generate(
+        #                       tokenized_text,
+        #                       max_length=256,
+        #                       num_beams=5,
+        #                       repetition_penalty=2.5,
+        #                       length_penalty=1.0,
+        #                       early_stopping=True
+        #                   )
+        #   line = self.t5tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+        return line
+
+    def feature_engineering(
+        self,
+        data: List,
+        client_id: str = None,
+        batch_size: int = None,
+        use_cache: bool = True,
+    ):
+        # only texts missing from the embedding cache (keyed by the preprocessed
+        # text, the model and its inference mode) are run through PhoBERT
+        self.load()
+        texts = [self.__preprocess(line) for line in data]
+        model_id = f"{self.__model_id}:{self.inference_mode}"
+        keys = [embedding_cache.key(text, model_id) for text in texts]
+        cached = (
+            embedding_cache.get_many(list(dict.fromkeys(keys))) if use_cache else {}
+        )
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if client_id and cached:
+            socket_worker.push(
+                SocketPayload(
+                    data={
+                        "time": get_current_timestamp(),
+                        "content": f"Lấy {len(keys) - len(missing)}/{len(keys)} dữ liệu văn bản từ bộ nhớ đệm",
+                    },
+                    channel="deployLog",
+                    client_id=client_id,
+                )
+            )
+        embedded = dict(
+            zip(
+                missing.keys(),
+                self.__embed(list(missing.values()), client_id, batch_size),
             )
-            # if len(line.split()) > 100: # Summary long text
-            # self.model.eval()
-            #   tokenized_text = self.t5tokenizer.encode(line, return_tensors="pt").to(self.__device)
-            #   summary_ids = model.generate(
-            #                       tokenized_text,
-            #                       max_length=256,
-            #                       num_beams=5,
-            #                       repetition_penalty=2.5,
-            #                       length_penalty=1.0,
-            #                       early_stopping=True
-            #                   )
-            #   line = self.t5tokenizer.decode(summary_ids[0], skip_special_tokens=True)
-            line = self.__tokenizer(line, truncation=True).input_ids  # tokenizer
-            input_ids = torch.tensor([line]).to(torch.long)
+        )
+        if use_cache:
+            embedding_cache.set_many(embedded)
+        features_set = np.array([cached.get(key, embedded.get(key)) for key in keys])
+        return features_set
+
+    def __embed(self, texts: List[str], client_id: str = None, batch_size: int = None):
+        # CLS vectors of PhoBERT, texts sorted by token length and run in padded
+        # batches (with attention masks) so that little padding is computed
+        batch_size = batch_size or project_config.EMBEDDING_BATCH_SIZE
+        input_ids = [
+            self.__tokenizer(text, truncation=True).input_ids for text in texts
+        ]  # tokenizer
+        order = sorted(range(len(input_ids)), key=lambda idx: len(input_ids[idx]))
+        features_set = [None] * len(input_ids)
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            inputs = self.__tokenizer.pad(
+                {"input_ids": [input_ids[idx] for idx in batch]}, return_tensors="pt"
+            ).to(self.__device)
             with torch.no_grad():  # Lấy features dầu ra từ BERT
-                features = self.__phobert(input_ids)
-            v_features = features[0][:, 0, :].numpy()
-            features_set.append(v_features[0])
+                features = self.__phobert(**inputs)
+            v_features = features[0][:, 0, :].cpu().numpy()
+            for idx, v_feature in zip(batch, v_features):
+                features_set[idx] = v_feature
             if client_id:
                 socket_worker.push(
                     SocketPayload(
                         data={
                             "time": get_current_timestamp(),
-                            "content": f"Dữ liệu văn bản số {line_idx}",
+                            "content": f"Dữ liệu văn bản {start + len(batch)}/{len(order)}",
                         },
                         channel="deployLog",
                         client_id=client_id,
                     )
                 )
-        features_set = np.array(features_set)
         return features_set
 
-    async def multilabel_binarizing(self, raw_data, classes, client_id: str = None):
+    def multilabel_binarizing(self, raw_data, classes, client_id: str = None):
         multilabel_binarizer = MultiLabelBinarizer(classes=classes, sparse_output=True)
         data = [i if isinstance(i, list) else [i] for i in raw_data]
         return multilabel_binarizer.fit_transform(data).toarray()
 
-    async def numerical_vectorize(slef, raw_data, client_id: str = None):
+    def numerical_vectorize(slef, raw_data, client_id: str = None):
         res = []
         for data in raw_data:
             try:
@@ -1,29 +1,38 @@
-import io
 import base64
-import sys
-import math
-import traceback
-import scipy.optimize
+import json
+import os
 import numpy as np
 import matplotlib.pyplot as plt
-from enum import Enum
-from scipy.spatial.distance import cdist, pdist, squareform
+from scipy import sparse
 from typing import Optional, List, Union
 
 from app.core.config import project_config
 from app.worker.socket import SocketPayload, socket_worker
-from app.util.time import get_current_timestamp
-
-
-class NormMode(Enum):
-    L2 = "l2_normalization"
-    MINMAX = "min_max_scaling"
+from app.util.fcm import (
+    DistanceMode,
+    NormMode,
+    PairwiseDistance,
+    SeedingMode,
+    average_silhouette,
+    centroid_shift,
+    euclidean_distance,
+    field_blocks,
+    fuzzy_centroid,
+    fuzzy_membership,
+    supervised_fuzzifier,
+    supervised_membership,
+    take_rows,
+    weighted_distance,
+)
+from app.util.chart import render_loss_chart
+from app.util.npy import encode_npz
+from app.util.time import PhaseTimer, get_current_timestamp
 
 
 class SSMC_FCM:
     def __init__(
         self,
-        dataset: List,
+        dataset: Union[List, np.ndarray, sparse.spmatrix],
         fields_len: List,
         fields_weight: Optional[List] = [],
         identity: Optional[List] = [],
@@ -35,208 +44,514 @@ class SSMC_FCM:
         n_loop: Optional[int] = 50,
         is_plot: Optional[bool] = False,
         norm_mode: Optional[str] = NormMode.MINMAX.value,
+        aswc_sample_size: Optional[int] = None,
+        seed: Optional[int] = None,
+        distance_mode: Optional[str] = None,
+        distance_block_size: Optional[int] = 1024,
+        distance_path: Optional[str] = None,
+        seeding: Optional[str] = SeedingMode.FARTHEST.value,
+        batch_size: Optional[int] = None,
+        init_centroid: Optional[List] = None,
+        init_membership: Optional[List] = None,
+        init_identity: Optional[List] = None,
+        init_fuzzifier: Optional[List] = None,
+        metric_every: Optional[int] = 1,
+        patience: Optional[int] = None,
+        loss_tol: Optional[float] = 0.0001,
+        fields_sparse: Optional[List] = None,
+        keep_history: Optional[bool] = True,
+        checkpoint_every: Optional[int] = None,
+        checkpoint_path: Optional[str] = None,
     ) -> None:
-        self.dataset = np.array(dataset)
         self.fields_len = fields_len
+        self.fields_slice = [
+            slice(start, start + field_len)
+            for start, field_len in zip(np.cumsum([0, *fields_len]), fields_len)
+        ]
+        self.__load_dataset(dataset, fields_sparse)
         self.fields_weight = fields_weight if fields_weight else [1] * len(fields_len)
         self.n_clusters = len(supervised_set)
-        self.identity = identity if identity else [i for i in range(len(dataset))]
+        self.identity = identity if identity else [i for i in range(self.n_points)]
         self.supervised_set = [
             [self.identity.index(j) for j in i] for i in supervised_set
         ]
+        self.supervised_points = np.array(
+            [id_point for cluster in self.supervised_set for id_point in cluster],
+            dtype=int,
+        )
+        self.supervised_labels = np.array(
+            [
+                id_cluster
+                for id_cluster, cluster in enumerate(self.supervised_set)
+                for _ in cluster
+            ],
+            dtype=int,
+        )
         self.fuzzi_M = fuzzi_M
         self.alpha = alpha
         self.epsilon = epsilon
-        self.membership = [[0] * self.n_clusters for i in range(len(dataset))]
-        self.fuzzi_set = [[fuzzi_M] * self.n_clusters for i in range(len(dataset))]
+        self.membership = np.zeros((self.n_points, self.n_clusters))
+        self.fuzzi_set = np.full((self.n_points, self.n_clusters), fuzzi_M, dtype=float)
         self.centroid = []
+        self.init_centroid = init_centroid
+        self.init_membership = init_membership
+        self.init_identity = init_identity
+        # M2 of the supervised points of a previous run (see export_model) is
+        # reused for the points still labelled with the same cluster
+        self.fixed_fuzzifier = np.zeros(self.n_points, dtype=bool)
+        self.__restore_fuzzifier(init_fuzzifier or [])
         self.n_loop = n_loop
+        self.metric_every = metric_every
+        self.patience = patience
+        self.loss_tol = loss_tol
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_path = checkpoint_path
         self.is_stop = False
         self.norm_mode = norm_mode
+        self.seeding = SeedingMode(seeding).value
+        self.keep_history = keep_history
         self.pred_labels = []
         self.pred_labels_idx = []
+        self.labels = None
         self.is_plot = is_plot
+        self.socket_worker = socket_worker
         self.loss_values = []
         self.Dij = None
         self.distance_matrix = [[]] * len(fields_len)
         self.DB_metric = []
-        self.dataset_distance_matrix = squareform(pdist(self.dataset))
+        self.metric_loops = []
+        # a mini-batch run never holds the n x n distance matrix: unless set,
+        # distances are computed block by block and ASWC uses batch_size points
+        is_minibatch = bool(batch_size) and batch_size < self.n_points
+        if distance_mode is None:
+            distance_mode = (
+                DistanceMode.BLOCKED.value
+                if is_minibatch
+                else DistanceMode.FLOAT64.value
+            )
+        if aswc_sample_size is None and is_minibatch:
+            aswc_sample_size = batch_size
+        self.pairwise_distance = PairwiseDistance(
+            self.dataset,
+            mode=distance_mode,
+            block_size=distance_block_size,
+            path=distance_path,
+        )
         self.ASWC_metric = []
+        self.timer = PhaseTimer()
+        self.rng = np.random.default_rng(seed)
+        self.aswc_points = (
+            np.sort(
+                self.rng.choice(self.n_points, size=aswc_sample_size, replace=False)
+            )
+            if aswc_sample_size and aswc_sample_size < self.n_points
+            else np.arange(self.n_points)
+        )
+
+    def __load_dataset(self, dataset, fields_sparse: Optional[List] = None):
+        # one block per field, dense or CSR (flagged in fields_sparse, or every
+        # field of a sparse dataset). A fully dense dataset stays one array with
+        # the fields as views, otherwise the dataset is the list of field
+        # blocks: dense fields are copied out and sparse ones never densified
+        if sparse.issparse(dataset):
+            dataset = sparse.csr_matrix(dataset, dtype=float)
+            fields_sparse = [True] * len(self.fields_len)
+        else:
+            dataset = np.array(dataset, dtype=float)
+            fields_sparse = fields_sparse or [False] * len(self.fields_len)
+        self.n_points = dataset.shape[0]
+        if not any(fields_sparse):
+            self.fields_data = [
+                dataset[:, field_slice] for field_slice in self.fields_slice
+            ]
+            self.dataset = dataset
+            return
+        self.fields_data = [
+            sparse.csr_matrix(dataset[:, field_slice])
+            if is_sparse
+            else (
+                dataset[:, field_slice].toarray()
+                if sparse.issparse(dataset)
+                else np.ascontiguousarray(dataset[:, field_slice])
+            )
+            for field_slice, is_sparse in zip(self.fields_slice, fields_sparse)
+        ]
+        self.dataset = self.fields_data
+
+    def __dataset_point(self, id_point):
+        return np.hstack(
+            [
+                block[id_point].toarray()[0]
+                if sparse.issparse(block)
+                else block[id_point]
+                for block in field_blocks(self.dataset)
+            ]
+        )
 
     def clustering(self, client_id: str = None):
-        self.__generate_centroid()
-        th_loop = 1
+        # a run with an existing checkpoint continues after its last saved loop
+        checkpoint = self.__load_checkpoint()
+        if checkpoint is None:
+            with self.timer.phase("seeding"):
+                self.__generate_centroid()
+        if self.batch_size and self.batch_size < self.n_points:
+            return self.__minibatch_clustering(client_id, checkpoint)
+        th_loop = checkpoint["th_loop"] + 1 if checkpoint else 1
         while th_loop <= self.n_loop and not self.is_stop:
-            if client_id:
-                socket_worker.push(
-                    SocketPayload(
-                        data={
-                            "time": get_current_timestamp(),
-                            "content": f"Lần lặp số {th_loop}",
-                        },
-                        channel="clusteringLog",
-                        client_id=client_id,
-                    )
-                )
+            self.__push_loop_log(th_loop, client_id)
             self.is_stop = True
-            self.__update_membership(th_loop)
-            self.__update_centroid(th_loop)
+            with self.timer.phase("membership"):
+                self.__update_membership(th_loop)
+            with self.timer.phase("centroid"):
+                self.__update_centroid(th_loop)
+
+            with self.timer.phase("norm_distance"):
+                self.__calculate_norm_distance()
+            with self.timer.phase("pred_labels"):
+                self.__calculate_pred_labels_idx()
+            with self.timer.phase("Dij"):
+                self.__calculate_Dij()
+
+            with self.timer.phase("loss"):
+                self.__calculate_loss_function()
+            if self.metric_every and th_loop % self.metric_every == 0:
+                self.__calculate_metrics(th_loop)
+            if self.__is_loss_plateau():
+                self.is_stop = True
+            self.__save_checkpoint(th_loop)
+            th_loop += 1
 
-            self.__calculate_norm_distance()
-            self.__calculate_pred_labels_idx()
-            self.__calculate_Dij()
+        # quality metrics always describe the final state
+        if th_loop - 1 not in self.metric_loops:
+            self.__calculate_metrics(th_loop - 1)
 
-            self.__calculate_loss_function()
+    def __calculate_metrics(self, th_loop):
+        with self.timer.phase("davies_bouldin"):
             self.__calculate_Davies_Bouldin()
+        with self.timer.phase("aswc"):
             self.__calculate_ASWC()
+        self.metric_loops.append(th_loop)
+
+    @property
+    def phase_time(self):
+        # seconds spent per phase of the last clustering run
+        return dict(self.timer.elapsed)
+
+    def __is_loss_plateau(self):
+        # relative loss improvement under loss_tol for `patience` loops in a row
+        if not self.patience or len(self.loss_values) <= self.patience:
+            return False
+        loss_values = np.array(self.loss_values[-self.patience - 1 :])
+        improvement = (loss_values[:-1] - loss_values[1:]) / np.maximum(
+            np.abs(loss_values[:-1]), np.finfo(float).tiny
+        )
+        return bool(np.all(improvement < self.loss_tol))
+
+    def __save_checkpoint(self, th_loop, **state):
+        # every checkpoint_every loops, written to a temporary file first so a
+        # crash while saving keeps the previous checkpoint
+        if not (
+            self.checkpoint_path
+            and self.checkpoint_every
+            and th_loop % self.checkpoint_every == 0
+        ):
+            return
+        with self.timer.phase("checkpoint"):
+            content = encode_npz(
+                th_loop=th_loop,
+                is_stop=self.is_stop,
+                centroid=self.centroid,
+                membership=self.membership,
+                fuzzi_set=self.fuzzi_set,
+                loss_values=self.loss_values,
+                DB_metric=self.DB_metric,
+                ASWC_metric=self.ASWC_metric,
+                metric_loops=self.metric_loops,
+                pred_labels=self.pred_labels,
+                rng_state=self.rng.bit_generator.state,
+                **state,
+            )
+            with open(f"{self.checkpoint_path}.tmp", "wb") as f:
+                f.write(content)
+            os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
+
+    def __load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with np.load(self.checkpoint_path, allow_pickle=False) as checkpoint:
+            state = {
+                key: json.loads(str(value)) if value.dtype.kind == "U" else value
+                for key, value in checkpoint.items()
+            }
+        self.centroid = state["centroid"]
+        self.membership = state["membership"]
+        self.fuzzi_set = state["fuzzi_set"]
+        self.is_stop = bool(state["is_stop"])
+        self.loss_values = state["loss_values"]
+        self.DB_metric = state["DB_metric"]
+        self.ASWC_metric = state["ASWC_metric"]
+        self.metric_loops = state["metric_loops"]
+        self.pred_labels = state["pred_labels"]
+        self.rng.bit_generator.state = state["rng_state"]
+        state["th_loop"] = int(state["th_loop"])
+        # distances and groups are derived from the centroids and memberships,
+        # as at the end of a loop (the saved pred_labels already hold its group)
+        self.__calculate_norm_distance()
+        self.__calculate_Dij()
+        self.__group_labels()
+        return state
+
+    def __minibatch_clustering(self, client_id: str = None, checkpoint=None):
+        # centroids follow random batches (always holding the supervised points),
+        # memberships and metrics of the whole dataset are computed once at the end
+        unsupervised_points = np.setdiff1d(
+            np.arange(self.n_points), self.supervised_points
+        )
+        batch_size = max(self.batch_size - len(self.supervised_points), 0)
+        centroid_weight = (
+            checkpoint["centroid_weight"] if checkpoint else np.zeros(self.n_clusters)
+        )
+        th_loop = checkpoint["th_loop"] + 1 if checkpoint else 1
+        while th_loop <= self.n_loop and not self.is_stop:
+            self.__push_loop_log(th_loop, client_id)
+            rows = np.concatenate(
+                [
+                    self.supervised_points,
+                    self.rng.choice(
+                        unsupervised_points,
+                        size=min(batch_size, len(unsupervised_points)),
+                        replace=False,
+                    ),
+                ]
+            )
+            with self.timer.phase("norm_distance"):
+                self.__calculate_norm_distance(rows)
+            with self.timer.phase("membership"):
+                membership = self.__calculate_membership(
+                    self.__calculate_weighted_distance(),
+                    np.arange(len(self.supervised_points)),
+                    th_loop,
+                )
+
+            # running weighted mean of the batch centroids per cluster
+            with self.timer.phase("centroid"):
+                weight = np.power(membership, self.fuzzi_set[rows])
+                batch_weight = np.sum(weight, axis=0)
+                centroid_weight += batch_weight
+                batch_centroid = fuzzy_centroid(
+                    take_rows(self.dataset, rows), membership, self.fuzzi_set[rows]
+                )
+                step = (batch_weight / centroid_weight)[:, None]
+                th_centroid = self.centroid + step * (batch_centroid - self.centroid)
+            self.is_stop = centroid_shift(self.centroid, th_centroid) <= self.epsilon
+            self.centroid = th_centroid
+            self.__save_checkpoint(th_loop, centroid_weight=centroid_weight)
             th_loop += 1
 
-    def __calculate_norm_distance(self):
-        __iter = 0
-        self.l2_distance = []
-        self.minmax_distance = []
-        for id_field, field_len in enumerate(self.fields_len):
-            distance_matrix = cdist(
-                self.dataset[:, __iter : __iter + field_len],
-                np.array(self.centroid)[:, __iter : __iter + field_len],
+        with self.timer.phase("norm_distance"):
+            self.__calculate_norm_distance()
+        with self.timer.phase("Dij"):
+            self.__calculate_Dij()
+        with self.timer.phase("membership"):
+            self.membership = self.__calculate_membership(
+                self.Dij, self.supervised_points, th_loop=None
+            )
+        with self.timer.phase("pred_labels"):
+            self.__calculate_pred_labels_idx()
+        with self.timer.phase("loss"):
+            self.__calculate_loss_function()
+        self.__calculate_metrics(th_loop - 1)
+
+    def __push_loop_log(self, th_loop, client_id: str = None):
+        if not client_id:
+            return
+        self.socket_worker.push(
+            SocketPayload(
+                data={
+                    "time": get_current_timestamp(),
+                    "content": f"Lần lặp số {th_loop}",
+                },
+                channel="clusteringLog",
+                client_id=client_id,
             )
-            self.l2_distance.append(np.linalg.norm(distance_matrix, axis=None))
-            self.minmax_distance.append(
-                (np.min(distance_matrix), np.max(distance_matrix))
+        )
+
+    def __calculate_norm_distance(self, rows: Optional[np.ndarray] = None):
+        centroid = np.array(self.centroid)
+        for id_field, field_slice in enumerate(self.fields_slice):
+            field_data = self.fields_data[id_field]
+            self.distance_matrix[id_field] = euclidean_distance(
+                field_data if rows is None else field_data[rows],
+                centroid[:, field_slice],
             )
-            self.distance_matrix[id_field] = distance_matrix
-            __iter += field_len
+        self.__calculate_norm_stats()
+
+    def __append_norm_distance(self, centroid):
+        # distances against one new centroid only, appended as a column
+        for id_field, field_slice in enumerate(self.fields_slice):
+            self.distance_matrix[id_field] = np.hstack(
+                [
+                    np.reshape(self.distance_matrix[id_field], (self.n_points, -1)),
+                    euclidean_distance(
+                        self.fields_data[id_field], centroid[None, field_slice]
+                    ),
+                ]
+            )
+        self.__calculate_norm_stats()
+
+    def __calculate_norm_stats(self):
+        self.l2_distance = [
+            np.linalg.norm(distance_matrix, axis=None)
+            for distance_matrix in self.distance_matrix
+        ]
+        self.minmax_distance = [
+            (np.min(distance_matrix), np.max(distance_matrix))
+            for distance_matrix in self.distance_matrix
+        ]
 
     def __calculate_pred_labels_idx(self):
+        pred_labels = self.__group_labels()
+        # without history only the latest grouping is kept
+        if not self.keep_history:
+            self.pred_labels.clear()
+        self.pred_labels.append(pred_labels)
+
+    def __group_labels(self):
+        # labels and point indexes per cluster of the current memberships,
+        # returns the identities per cluster
+        self.labels = np.argmax(self.membership, axis=1)
         self.pred_labels_idx = [[] for _ in range(self.n_clusters)]
         pred_labels = [[] for _ in range(self.n_clusters)]
-        for idx, membership in enumerate(self.membership):
-            id_cluster = np.argmax(membership)
+        for idx, id_cluster in enumerate(self.labels):
             self.pred_labels_idx[id_cluster].append(idx)
             pred_labels[id_cluster].append(self.identity[idx])
-        self.pred_labels.append(pred_labels)
         self.pred_labels_idx = np.array(self.pred_labels_idx, dtype=object)
+        return pred_labels
 
     def __generate_centroid(self):
+        if self.__warm_start():
+            return
         # computing centroid for supervised clusters
         for supervised_in_cluster in self.supervised_set:
             __centroid = []
             if not supervised_in_cluster:
                 continue
-            supervised_data = [self.dataset[i] for i in supervised_in_cluster]
-            __centroid = np.sum(supervised_data, axis=0) / len(supervised_in_cluster)
+            __centroid = np.hstack(
+                [
+                    np.asarray(block[supervised_in_cluster].sum(axis=0)).ravel()
+                    for block in field_blocks(self.dataset)
+                ]
+            ) / len(supervised_in_cluster)
             self.centroid.append(__centroid)
         if self.centroid:
             self.__calculate_norm_distance()
 
-        # computing random centroid for unsupervised clusters (apply kmean++)
+        # computing centroid for unsupervised clusters, farthest point or kmean++
+        # (only the distances to the newly added centroid are computed per pick)
         for k in range(self.n_clusters - len(self.centroid)):
-            ## initialize a list to store distances of data
-            ## points from nearest centroid
-            dist = []
-            for id_point in range(self.dataset.shape[0]):
-                d = sys.maxsize
-
-                ## compute distance of 'point' from each of the previously
-                ## selected centroid and store the minimum distance
-                for id_centroid in range(len(self.centroid)):
-                    temp_dist = self.__calculate_point_distance(id_point, id_centroid)
-                    d = min(d, temp_dist)
-                dist.append(d)
-
-            ## select data point with maximum distance as our next centroid
-            dist = np.array(dist)
-            next_centroid = self.dataset[np.argmax(dist), :]
+            ## distance of every point from its nearest selected centroid
+            dist = (
+                self.__calculate_weighted_distance().min(axis=1)
+                if len(self.centroid)
+                else np.zeros(self.n_points)
+            )
+
+            if self.seeding == SeedingMode.KMEANS_PP.value and np.sum(dist) > 0:
+                ## sample the next centroid with probability proportional to D^2
+                id_point = self.rng.choice(
+                    self.n_points, p=dist**2 / np.sum(dist**2)
+                )
+            elif self.seeding == SeedingMode.KMEANS_PP.value:
+                id_point = self.rng.integers(self.n_points)
+            else:
+                ## select data point with maximum distance as our next centroid
+                id_point = np.argmax(dist)
+            next_centroid = self.__dataset_point(id_point)
             self.centroid.append(next_centroid)
-            self.__calculate_norm_distance()
+            self.__append_norm_distance(next_centroid)
 
         self.centroid = np.array(self.centroid)
         self.plot("Initial Centroids")
 
+    def __warm_start(self):
+        # continue from a previous result: its centroids, or centroids rebuilt
+        # from its memberships of the points (matched by identity) still present;
+        # memberships without identities are only used for a same-sized dataset
+        shape = (self.n_clusters, sum(self.fields_len))
+        if self.init_centroid is not None and np.shape(self.init_centroid) == shape:
+            self.centroid = np.array(self.init_centroid, dtype=float)
+        elif self.init_membership is not None and len(self.init_membership):
+            init_membership = np.array(self.init_membership, dtype=float)
+            init_identity = self.init_identity
+            if not init_identity and len(init_membership) == self.n_points:
+                init_identity = self.identity
+            if not init_identity or len(init_identity) != len(init_membership):
+                return False
+            id_points = {identity: idx for idx, identity in enumerate(self.identity)}
+            rows = [
+                (id_points[identity], idx)
+                for idx, identity in enumerate(init_identity)
+                if identity in id_points
+            ]
+            if not rows or init_membership.shape[1:] != (self.n_clusters,):
+                return False
+            id_new, id_old = np.array(rows).T
+            self.centroid = fuzzy_centroid(
+                take_rows(self.dataset, id_new),
+                init_membership[id_old],
+                self.fuzzi_set[id_new],
+            )
+        else:
+            return False
+        self.__calculate_norm_distance()
+        self.plot("Initial Centroids")
+        return True
+
+    def __restore_fuzzifier(self, init_fuzzifier: List):
+        id_points = {
+            (self.identity[id_point], id_cluster): id_point
+            for id_point, id_cluster in zip(
+                self.supervised_points, self.supervised_labels
+            )
+        }
+        for identity, id_cluster, fuzzifier in init_fuzzifier:
+            id_point = id_points.get((identity, id_cluster))
+            if id_point is not None:
+                self.fuzzi_set[id_point] = fuzzifier
+                self.fixed_fuzzifier[id_point] = True
+
     def __update_membership(self, th_loop):
-        fuzzi_M_pow = 1 / (self.fuzzi_M - 1)
         if self.Dij is None:
-            self.Dij = [
-                [
-                    self.__calculate_point_distance(id_point, id_centroid)
-                    for id_centroid in range(len(self.centroid))
-                ]
-                for id_point in range(len(self.dataset))
-            ]
+            self.__calculate_Dij()
+        self.membership = self.__calculate_membership(
+            self.Dij, self.supervised_points, th_loop
+        )
 
+    def __calculate_membership(self, Dij, supervised_rows, th_loop):
+        # supervised_rows: rows of Dij holding self.supervised_points, in order
         # without supervision
-        for id_point in range(len(self.dataset)):
-            Dij_pow = []
-            sum_Dij_pow = 0
-            for id_centroid in range(len(self.centroid)):
-                Dik_pow = math.pow(self.Dij[id_point][id_centroid], fuzzi_M_pow)
-                Dij_pow.append(Dik_pow)
-                sum_Dij_pow += 1 / Dik_pow
-
-            membership = [1 / (Dik_pow * sum_Dij_pow) for Dik_pow in Dij_pow]
-            self.membership[id_point] = membership
+        membership = fuzzy_membership(Dij, self.fuzzi_M)
 
         # with supervision
         if th_loop == 2:
-            self.__calculate_M2()
-        for id_cluster, supervised_cluster in enumerate(self.supervised_set):
-            for id_point in supervised_cluster:
-                fuzzi_M2 = self.fuzzi_set[id_point][id_cluster]
-                dmin = min(self.Dij[id_point])
-                dij = [distance_ij / dmin for distance_ij in self.Dij[id_point]]
-                uij = [
-                    math.pow(1 / (self.fuzzi_M * pow(dij[k], 2)), fuzzi_M_pow)
-                    if k != id_cluster
-                    else 0
-                    for k in range(self.n_clusters)
-                ]
-                right_expression = math.pow(
-                    1 / (fuzzi_M2 * pow(dij[id_cluster], 2)), 1 / (fuzzi_M2 - 1)
-                )
-                uik_pow = (fuzzi_M2 - self.fuzzi_M) / (fuzzi_M2 - 1)
-
-                def __func(uik):
-                    res = uik / ((uik + sum(uij)) ** uik_pow) - right_expression
-                    return res
-
-                try:
-                    uik = scipy.optimize.fsolve(__func, 0)
-                    uik = uik[0]
-                    if not isinstance(uik, float):
-                        raise Exception("uik is complex")
-                    uij[id_cluster] = uik
-                except:
-                    traceback.print_exc()
-                    continue
-                membership = [uik / sum(uij) for uik in uij]
-                self.membership[id_point] = membership
+            self.__calculate_M2(membership[supervised_rows])
+        if not len(self.supervised_points):
+            return membership
+        supervised_membership_, is_valid = supervised_membership(
+            Dij[supervised_rows],
+            self.supervised_labels,
+            self.fuzzi_M,
+            self.fuzzi_set[self.supervised_points, self.supervised_labels],
+        )
+        membership[supervised_rows[is_valid]] = supervised_membership_[is_valid]
+        return membership
 
     def __update_centroid(self, th_loop):
-        th_centroid = []
-        for id_centroid in range(len(self.centroid)):
-            uik_pow = [
-                math.pow(
-                    self.membership[id_point][id_centroid],
-                    self.fuzzi_set[id_point][id_centroid],
-                )
-                for id_point in range(len(self.dataset))
-            ]
-            new_centroid = np.sum(
-                [uik * np.array(point) for uik, point in zip(uik_pow, self.dataset)],
-                axis=0,
-            ) / sum(uik_pow)
-            th_centroid.append(new_centroid)
-        if (
-            sum(
-                [
-                    self.__calculate_euclid_distance(old_centroid, new_centroid)
-                    for old_centroid, new_centroid in zip(self.centroid, th_centroid)
-                ]
-            )
-            > self.epsilon
-        ):
+        th_centroid = fuzzy_centroid(self.dataset, self.membership, self.fuzzi_set)
+        if centroid_shift(self.centroid, th_centroid) > self.epsilon:
             self.is_stop = False
-        self.centroid = np.array(th_centroid)
+        self.centroid = th_centroid
         self.plot(f"{th_loop}-th loop")
 
     def plot(self, title: Optional[str] = None):
@@ -287,71 +602,18 @@ class SSMC_FCM:
         plt.ylim(min(self.dataset[:, 1]), max(self.dataset[:, 1]))
         plt.show()
 
-    def __calculate_M2(self):
-        for id_cluster, supervised_cluster in enumerate(self.supervised_set):
-            for id_point in supervised_cluster:
-                if self.membership[id_point][id_cluster] >= self.alpha:
-                    continue
-                right_expression = self.fuzzi_M * math.pow(
-                    (
-                        (1 - self.alpha)
-                        / (1 / self.membership[id_point][id_cluster] - 1)
-                    ),
-                    self.fuzzi_M - 1,
-                )
-
-                def __func(fuzzi_M2):
-                    res = (
-                        fuzzi_M2 * math.pow(self.alpha, fuzzi_M2 - 1) - right_expression
-                    )
-                    return res
-
-                try:
-                    fuzzi_M2 = scipy.optimize.fsolve(__func, self.fuzzi_M)
-                    fuzzi_M2 = fuzzi_M2[0]
-                    if not isinstance(fuzzi_M2, float):
-                        raise Exception("fuzzi_M2 is complex")
-                    fuzzi_M2 = fuzzi_M2 if fuzzi_M2 > self.fuzzi_M else self.fuzzi_M
-                    self.fuzzi_set[id_point] = [fuzzi_M2] * self.n_clusters
-                except:
-                    traceback.print_exc()
-
-    def __calculate_point_distance(self, id_point, id_centroid):
-        __iter = 0
-        distance = 0
-        for id_field, (
-            field_len,
-            field_weight,
-            l2_distance,
-            minmax_distance,
-        ) in enumerate(
-            zip(
-                self.fields_len,
-                self.fields_weight,
-                self.l2_distance,
-                self.minmax_distance,
-            )
-        ):
-            __distance = self.distance_matrix[id_field][id_point][id_centroid]
-            if self.norm_mode == NormMode.L2.value:
-                field_distance = (
-                    0 if l2_distance == 0 else field_weight * __distance / l2_distance
-                )
-            elif self.norm_mode == NormMode.MINMAX.value:
-                min_distance, max_distance = minmax_distance
-                field_distance = (
-                    0
-                    if max_distance == 0
-                    else field_weight * (__distance - min_distance) / max_distance
-                )
-                try:
-                    if field_distance < 0:
-                        raise Exception("Distance negative!!!")
-                except:
-                    traceback.print_exc()
-            distance += field_distance
-            __iter += field_len
-        return distance if distance else self.epsilon**2
+    def __calculate_M2(self, membership):
+        if not len(self.supervised_points):
+            return
+        membership = membership[np.arange(len(membership)), self.supervised_labels]
+        is_below = (membership < self.alpha) & ~self.fixed_fuzzifier[
+            self.supervised_points
+        ]
+        fuzzi_M2, is_valid = supervised_fuzzifier(
+            membership[is_below], self.fuzzi_M, self.alpha
+        )
+        id_points = self.supervised_points[is_below][is_valid]
+        self.fuzzi_set[id_points] = fuzzi_M2[is_valid, None]
 
     def __calculate_centroid_distance(self, id_centroid1, id_centroid2):
         __iter = 0
@@ -395,32 +657,22 @@ class SSMC_FCM:
     def __calculate_euclid_distance(self, p1, p2):
         return np.linalg.norm(np.array(p1) - np.array(p2))
 
+    def __calculate_weighted_distance(self):
+        return weighted_distance(
+            self.distance_matrix,
+            self.fields_weight,
+            self.l2_distance,
+            self.minmax_distance,
+            self.norm_mode,
+            self.epsilon,
+        )
+
     def __calculate_Dij(self):
-        self.Dij = [
-            [
-                self.__calculate_point_distance(id_point, id_centroid)
-                for id_centroid in range(len(self.centroid))
-            ]
-            for id_point in range(len(self.dataset))
-        ]
+        self.Dij = self.__calculate_weighted_distance()
 
     def __calculate_loss_function(self):
         self.loss_values.append(
-            sum(
-                [
-                    sum(
-                        [
-                            math.pow(
-                                self.membership[id_point][id_centroid],
-                                self.fuzzi_set[id_point][id_centroid],
-                            )
-                            * self.Dij[id_point][id_centroid]
-                            for id_centroid in range(len(self.centroid))
-                        ]
-                    )
-                    for id_point in range(len(self.dataset))
-                ]
-            )
+            float(np.sum(np.power(self.membership, self.fuzzi_set) * self.Dij))
         )
 
     def __calculate_Davies_Bouldin(self):
@@ -460,29 +712,50 @@ class SSMC_FCM:
             / len(self.centroid)
         )
 
+    @property
+    def dataset_distance_matrix(self):
+        return self.pairwise_distance.matrix
+
     def __calculate_ASWC(self):
-        sx = []
-        for id_point in range(len(self.dataset)):
-            aij = bij = 0
-            for cluster in self.pred_labels_idx:
-                qij = np.mean(
-                    [
-                        self.dataset_distance_matrix[id_point][id_another]
-                        for id_another in cluster
-                    ]
+        cluster_indicator = np.eye(self.n_clusters)[self.labels]
+        self.ASWC_metric.append(
+            average_silhouette(
+                self.pairwise_distance.dot(self.aswc_points, cluster_indicator),
+                self.labels,
+                self.aswc_points,
+            )
+        )
+
+    def export_model(self):
+        # everything predict_membership needs to place new points
+        return {
+            "centroid": self.centroid.tolist(),
+            "identity": list(self.identity),
+            "fuzzifier": [
+                [self.identity[id_point], int(id_cluster), float(fuzzifier)]
+                for id_point, id_cluster, fuzzifier in zip(
+                    self.supervised_points,
+                    self.supervised_labels,
+                    self.fuzzi_set[self.supervised_points, self.supervised_labels],
                 )
-                if id_point in cluster:
-                    aij = qij
-                elif bij < qij:
-                    bij = qij
-            sx.append(bij / (aij + 0.000001))
-        self.ASWC_metric.append(sum(sx) / len(self.dataset))
+            ],
+            "fields_len": list(self.fields_len),
+            "fields_weight": list(self.fields_weight),
+            "norm_mode": self.norm_mode,
+            "fuzzi_M": self.fuzzi_M,
+            "epsilon": self.epsilon,
+            "l2_distance": [float(distance) for distance in self.l2_distance],
+            "minmax_distance": [
+                [float(min_distance), float(max_distance)]
+                for min_distance, max_distance in self.minmax_distance
+            ],
+        }
 
     def show_cluster_members(self):
         len_supervised = sum(
             [len(supervised_set) for supervised_set in self.supervised_set]
         )
-        len_dataset = len(self.dataset)
+        len_dataset = self.n_points
         print(
             f"Supervised percentage: {round(100 * len_supervised / len_dataset, 2)}% ({len_supervised}:{len_dataset})"
         )
@@ -490,27 +763,21 @@ class SSMC_FCM:
         for cluster in self.pred_labels:
             print(cluster)
 
+    def metric_series(self):
+        # raw series behind the loss chart
+        return {
+            "loss": [float(loss) for loss in self.loss_values],
+            "metric_loops": list(self.metric_loops),
+            "davies_bouldin": [float(metric) for metric in self.DB_metric],
+            "aswc": [float(metric) for metric in self.ASWC_metric],
+        }
+
     def show_loss_function(self, client_id: str = None):
-        plt.clf()
-        plt.figure(figsize=(12, 4))
-        plt.subplot(311)
-        plt.plot(self.loss_values)
-        plt.title("Target function")
-        plt.subplot(312)
-        plt.plot(self.DB_metric)
-        plt.title("DB metric")
-        plt.subplot(313)
-        plt.plot(self.ASWC_metric)
-        plt.title("ASWC metric")
-        plt.tight_layout()
-        plt.xticks(list(range(len(self.ASWC_metric))))
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format="png")
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        buffer.close()
+        image_base64 = base64.b64encode(
+            render_loss_chart(self.metric_series())
+        ).decode()
         if client_id:
-            socket_worker.push(
+            self.socket_worker.push(
                 SocketPayload(
                     data={
                         "time": get_current_timestamp(),
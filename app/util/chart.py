@@ -0,0 +1,23 @@
+import io
+from typing import Dict
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def render_loss_chart(metrics: Dict) -> bytes:
+    # png of the loss / DB / ASWC series. A standalone Agg figure per call
+    # keeps rendering headless and free of pyplot's global state
+    figure = Figure(figsize=(12, 4))
+    FigureCanvasAgg(figure)
+    loss_axes, db_axes, aswc_axes = figure.subplots(3, 1)
+    loss_axes.plot(range(1, len(metrics["loss"]) + 1), metrics["loss"])
+    loss_axes.set_title("Target function")
+    db_axes.plot(metrics["metric_loops"], metrics["davies_bouldin"])
+    db_axes.set_title("DB metric")
+    aswc_axes.plot(metrics["metric_loops"], metrics["aswc"])
+    aswc_axes.set_title("ASWC metric")
+    figure.tight_layout()
+    aswc_axes.set_xticks(metrics["metric_loops"])
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
@@ -0,0 +1,334 @@
+import os
+import tempfile
+import numpy as np
+from enum import Enum
+from scipy import sparse
+from scipy.spatial.distance import cdist, pdist, squareform
+from typing import List, Optional, Tuple, Union
+
+
+class NormMode(Enum):
+    L2 = "l2_normalization"
+    MINMAX = "min_max_scaling"
+
+
+class SeedingMode(Enum):
+    FARTHEST = "farthest"
+    KMEANS_PP = "kmeans++"
+
+
+class DistanceMode(Enum):
+    FLOAT64 = "float64"
+    FLOAT32 = "float32"
+    MEMMAP = "memmap"
+    BLOCKED = "blocked"
+
+
+class PairwiseDistance:
+    # n x n euclid distances between dataset points, built on first use:
+    # in memory (float64 / float32), in a float32 memory-mapped file, or
+    # never stored and recomputed block by block (blocked). A memmap `path`
+    # that already exists is opened read-only, so processes can share it.
+    # `dataset` may be a scipy sparse matrix or a list of per-field blocks
+    def __init__(
+        self,
+        dataset: Union[np.ndarray, sparse.spmatrix, List],
+        mode: str = DistanceMode.FLOAT64.value,
+        block_size: int = 1024,
+        path: Optional[str] = None,
+    ) -> None:
+        self.dataset = dataset
+        self.mode = DistanceMode(mode).value
+        self.block_size = block_size
+        self.path = path
+        self.__matrix = None
+        self.__file = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self.__matrix is None:
+            self.__matrix = self.__build()
+        return self.__matrix
+
+    def __build(self) -> np.ndarray:
+        blocks = field_blocks(self.dataset)
+        n_points = blocks[0].shape[0]
+        if self.mode == DistanceMode.FLOAT64.value:
+            # pdist on dense field blocks, the sparse kernel on CSR ones
+            dense_blocks = [block for block in blocks if not sparse.issparse(block)]
+            if len(blocks) == 1 and dense_blocks:
+                return squareform(pdist(dense_blocks[0]))
+            squared = (
+                squareform(sum(pdist(block, "sqeuclidean") for block in dense_blocks))
+                if dense_blocks
+                else np.zeros((n_points, n_points))
+            )
+            for block in blocks:
+                if sparse.issparse(block):
+                    squared += squared_euclidean_distance(block, block)
+            return np.sqrt(squared, out=squared)
+        if self.mode == DistanceMode.MEMMAP.value and self.path:
+            if os.path.exists(self.path):
+                return np.load(self.path, mmap_mode="r")
+            matrix = np.lib.format.open_memmap(
+                self.path, dtype=np.float32, mode="w+", shape=(n_points, n_points)
+            )
+        elif self.mode == DistanceMode.MEMMAP.value:
+            self.__file = tempfile.TemporaryFile()
+            matrix = np.memmap(
+                self.__file, dtype=np.float32, mode="w+", shape=(n_points, n_points)
+            )
+        else:
+            matrix = np.empty((n_points, n_points), dtype=np.float32)
+        for start in range(0, n_points, self.block_size):
+            matrix[start : start + self.block_size] = self.__block(start)
+        if isinstance(matrix, np.memmap):
+            matrix.flush()
+        return matrix
+
+    def __block(self, start: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        rows = (
+            np.arange(field_blocks(self.dataset)[0].shape[0]) if rows is None else rows
+        )
+        return euclidean_distance(
+            take_rows(self.dataset, rows[start : start + self.block_size]),
+            self.dataset,
+        )
+
+    def dot(self, rows: np.ndarray, other: np.ndarray) -> np.ndarray:
+        # distance[rows] @ other, without materializing the matrix in blocked mode
+        if self.mode != DistanceMode.BLOCKED.value:
+            return self.matrix[rows] @ other
+        return np.concatenate(
+            [
+                self.__block(start, rows) @ other
+                for start in range(0, len(rows), self.block_size)
+            ]
+        )
+
+
+def euclidean_distance(
+    XA: Union[np.ndarray, sparse.spmatrix, List],
+    XB: Union[np.ndarray, sparse.spmatrix, List],
+) -> np.ndarray:
+    # cdist for dense inputs; lists of per-field blocks sum the squared
+    # distances of each pair of blocks
+    if isinstance(XA, list):
+        return np.sqrt(sum(squared_euclidean_distance(A, B) for A, B in zip(XA, XB)))
+    if not sparse.issparse(XA) and not sparse.issparse(XB):
+        return cdist(XA, XB)
+    return np.sqrt(squared_euclidean_distance(XA, XB))
+
+
+def squared_euclidean_distance(
+    XA: Union[np.ndarray, sparse.spmatrix], XB: Union[np.ndarray, sparse.spmatrix]
+) -> np.ndarray:
+    # with a sparse side, |a|^2 - 2 a.b + |b|^2 so the cost follows the
+    # non-zeros (e.g. one-hot categorical fields)
+    if not sparse.issparse(XA) and not sparse.issparse(XB):
+        return cdist(XA, XB, "sqeuclidean")
+    product = XA @ XB.T
+    product = product.toarray() if sparse.issparse(product) else np.asarray(product)
+    squared = (
+        row_squared_norm(XA)[:, None] - 2 * product + row_squared_norm(XB)[None, :]
+    )
+    return np.maximum(squared, 0)
+
+
+def field_blocks(dataset: Union[np.ndarray, sparse.spmatrix, List]) -> List:
+    # a dataset is a single (dense or sparse) matrix or a list of field blocks
+    return dataset if isinstance(dataset, list) else [dataset]
+
+
+def take_rows(dataset: Union[np.ndarray, sparse.spmatrix, List], rows):
+    if isinstance(dataset, list):
+        return [block[rows] for block in dataset]
+    return dataset[rows]
+
+
+def row_squared_norm(X: Union[np.ndarray, sparse.spmatrix]) -> np.ndarray:
+    if sparse.issparse(X):
+        return np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    return np.einsum("ij,ij->i", X, X)
+
+
+def fuzzy_membership(Dij: np.ndarray, fuzzi_M: float) -> np.ndarray:
+    # u_ik = 1 / (D_ik^p * sum_j D_ij^-p), p = 1 / (M - 1), on a (n, k) matrix
+    Dij_pow = np.power(Dij, 1 / (fuzzi_M - 1))
+    return 1 / (Dij_pow * np.sum(1 / Dij_pow, axis=1, keepdims=True))
+
+
+def weighted_distance(
+    distance_matrix: List[np.ndarray],
+    fields_weight: List,
+    l2_distance: List[float],
+    minmax_distance: List[Tuple[float, float]],
+    norm_mode: str,
+    epsilon: float,
+) -> np.ndarray:
+    # sum over fields of weight * normalized field distance, (f, n, k) -> (n, k)
+    fields_weight = np.asarray(fields_weight, dtype=float)
+    if norm_mode == NormMode.L2.value:
+        norm = np.asarray(l2_distance, dtype=float)
+        offset = np.zeros_like(norm)
+    elif norm_mode == NormMode.MINMAX.value:
+        offset, norm = np.asarray(minmax_distance, dtype=float).reshape(-1, 2).T
+    else:
+        raise ValueError(f"Unsupported norm mode: {norm_mode}")
+    scale = np.divide(fields_weight, norm, out=np.zeros_like(norm), where=norm != 0)
+    Dij = np.einsum(
+        "f,fnk->nk", scale, np.asarray(distance_matrix) - offset[:, None, None]
+    )
+    Dij[Dij == 0] = epsilon**2
+    return Dij
+
+
+def predict_membership(
+    dataset: np.ndarray,
+    centroid: np.ndarray,
+    fields_len: List,
+    fields_weight: List,
+    l2_distance: List[float],
+    minmax_distance: List[Tuple[float, float]],
+    norm_mode: str,
+    fuzzi_M: float,
+    epsilon: float,
+) -> np.ndarray:
+    # memberships of new points against fixed centroids and the field
+    # normalization stats of the run that produced them
+    distance_matrix = []
+    start = 0
+    for field_len, (min_distance, _) in zip(fields_len, minmax_distance):
+        field_slice = slice(start, start + field_len)
+        distance_matrix.append(
+            # new points closer than the stored min would turn negative
+            np.maximum(
+                euclidean_distance(dataset[:, field_slice], centroid[:, field_slice]),
+                min_distance if norm_mode == NormMode.MINMAX.value else 0,
+            )
+        )
+        start += field_len
+    Dij = weighted_distance(
+        distance_matrix,
+        fields_weight,
+        l2_distance,
+        minmax_distance,
+        norm_mode,
+        epsilon,
+    )
+    return fuzzy_membership(Dij, fuzzi_M)
+
+
+def fuzzy_centroid(
+    dataset: Union[np.ndarray, sparse.spmatrix, List],
+    membership: np.ndarray,
+    fuzzi_set: np.ndarray,
+) -> np.ndarray:
+    # v_k = sum_i u_ik^m_ik * x_i / sum_i u_ik^m_ik, as (X.T @ U ** M).T per
+    # field block, which stays a dense (k, d) array for sparse blocks as well
+    weight = np.power(membership, fuzzi_set)
+    return (
+        np.hstack([np.asarray(block.T @ weight).T for block in field_blocks(dataset)])
+        / np.sum(weight, axis=0)[:, None]
+    )
+
+
+def centroid_shift(old_centroid: np.ndarray, new_centroid: np.ndarray) -> float:
+    return float(np.sum(np.linalg.norm(new_centroid - old_centroid, axis=1)))
+
+
+def bisect(func, lo: np.ndarray, hi: np.ndarray, max_iter: int = 200, xtol=1e-12):
+    # elementwise bisection, func(lo) and func(hi) must have opposite signs
+    lo, hi = lo.astype(float), hi.astype(float)
+    f_lo = func(lo)
+    for _ in range(max_iter):
+        mid = (lo + hi) / 2
+        f_mid = func(mid)
+        is_left = np.sign(f_mid) == np.sign(f_lo)
+        lo, f_lo = np.where(is_left, mid, lo), np.where(is_left, f_mid, f_lo)
+        hi = np.where(is_left, hi, mid)
+        if np.all(hi - lo <= xtol * np.maximum(1, np.abs(mid))):
+            break
+    return (lo + hi) / 2
+
+
+def supervised_membership(
+    Dij: np.ndarray, labels: np.ndarray, fuzzi_M: float, fuzzi_M2: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    # memberships of the supervised points (rows of Dij) towards their labels,
+    # solving u / (u + sum_j u_j) ^ p = right for u on every row at once
+    rows = np.arange(len(labels))
+    dij = Dij / np.min(Dij, axis=1, keepdims=True)
+    uij = np.power(1 / (fuzzi_M * dij**2), 1 / (fuzzi_M - 1))
+    uij[rows, labels] = 0
+    sum_uij = np.sum(uij, axis=1)
+    right_expression = np.power(
+        1 / (fuzzi_M2 * dij[rows, labels] ** 2), 1 / (fuzzi_M2 - 1)
+    )
+    uik_pow = (fuzzi_M2 - fuzzi_M) / (fuzzi_M2 - 1)
+
+    # the left side is increasing in u from 0, and u >= sum_j u_j implies it
+    # is >= u ^ (1 - p) / 2 ^ p, which bounds the root from above
+    hi = np.maximum.reduce(
+        [
+            sum_uij,
+            right_expression,
+            np.power(right_expression * 2**uik_pow, 1 / (1 - uik_pow)),
+        ]
+    )
+    uik = bisect(
+        lambda uik: uik / (uik + sum_uij) ** uik_pow - right_expression,
+        np.zeros_like(hi),
+        hi,
+    )
+    uij[rows, labels] = uik
+    membership = uij / np.sum(uij, axis=1, keepdims=True)
+    return membership, np.all(np.isfinite(membership), axis=1)
+
+
+def supervised_fuzzifier(
+    membership: np.ndarray, fuzzi_M: float, alpha: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    # fuzzifier M2 >= M lifting each supervised membership (below alpha) to alpha,
+    # the root of M2 * alpha ^ (M2 - 1) = right nearest to M
+    right_expression = fuzzi_M * np.power(
+        (1 - alpha) / (1 / membership - 1), fuzzi_M - 1
+    )
+
+    def __func(fuzzi_M2):
+        return fuzzi_M2 * np.power(alpha, fuzzi_M2 - 1) - right_expression
+
+    # the left side increases up to its peak at -1 / ln(alpha), then decreases
+    peak = -1 / np.log(alpha)
+    lo = np.full_like(right_expression, fuzzi_M, dtype=float)
+    if fuzzi_M < peak:
+        hi = np.full_like(lo, peak)
+        is_valid = (__func(lo) < 0) & (__func(hi) >= 0)
+    else:
+        hi = 2 * lo
+        for _ in range(64):
+            is_above = __func(hi) > 0
+            if not np.any(is_above):
+                break
+            hi = np.where(is_above, 2 * hi, hi)
+        is_valid = (__func(lo) > 0) & (__func(hi) <= 0)
+    fuzzi_M2 = np.full_like(lo, fuzzi_M)
+    if np.any(is_valid):
+        fuzzi_M2[is_valid] = bisect(__func, lo, hi)[is_valid]
+    return fuzzi_M2, is_valid
+
+
+def average_silhouette(
+    cluster_distance: np.ndarray, labels: np.ndarray, rows: np.ndarray
+) -> float:
+    # cluster_distance[i, c] is the summed distance from the scored point
+    # rows[i] to the members of cluster c (distance rows @ cluster indicator)
+    n_clusters = cluster_distance.shape[1]
+    n_members = np.bincount(labels, minlength=n_clusters)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        qij = cluster_distance / n_members
+    own_cluster = labels[rows]
+    aij = qij[np.arange(len(rows)), own_cluster]
+    is_other = (n_members > 0) & (np.arange(n_clusters) != own_cluster[:, None])
+    bij = np.max(np.where(is_other, qij, 0), axis=1)
+    return float(np.mean(bij / (aij + 0.000001)))
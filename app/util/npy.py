@@ -0,0 +1,40 @@
+import io
+import json
+import base64
+import numpy as np
+
+
+# memberships quantized to uint8 are stored as round(u * 255)
+UINT8_SCALE = 255
+
+
+def quantize_membership(membership: np.ndarray, dtype: str) -> np.ndarray:
+    if np.dtype(dtype) == np.uint8:
+        return np.rint(np.clip(membership, 0, 1) * UINT8_SCALE).astype(np.uint8)
+    return np.asarray(membership, dtype=dtype)
+
+
+def encode_npy(array: np.ndarray) -> str:
+    # base64 of the .npy file, np.load(io.BytesIO(b64decode(...))) on the client
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def decode_npy(data: str) -> np.ndarray:
+    return np.load(io.BytesIO(base64.b64decode(data)), allow_pickle=False)
+
+
+def encode_npz(**arrays) -> bytes:
+    # dicts and lists (model, grouped labels) are stored as json strings
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        **{
+            key: np.array(json.dumps(value))
+            if isinstance(value, (dict, list))
+            else value
+            for key, value in arrays.items()
+        },
+    )
+    return buffer.getvalue()
@@ -1,4 +1,5 @@
 import time
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional
 from dateutil.relativedelta import relativedelta
@@ -47,3 +48,19 @@ def convert_timestamp(timestamp):
     dt = datetime.fromtimestamp(timestamp_seconds)
     formatted_date = dt.strftime("%d-%m-%Y %H:%M")
     return formatted_date
+
+
+class PhaseTimer:
+    # wall time summed per named phase, e.g. `with timer.phase("centroid"): ...`
+    def __init__(self) -> None:
+        self.elapsed = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed[name] = (
+                self.elapsed.get(name, 0.0) + time.perf_counter() - start_time
+            )
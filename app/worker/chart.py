@@ -0,0 +1,55 @@
+import base64
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+
+from app.util.chart import render_loss_chart
+from app.util.time import get_current_timestamp
+from app.worker.socket import SocketPayload, socket_worker
+
+
+class ChartWorker:
+    # renders loss charts off the request path, one png cached per result
+    def __init__(self):
+        print("--- chart worker has been created")
+        self.__executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="chart-worker"
+        )
+        self.__charts: Dict[str, Future] = {}
+        self.__lock = threading.Lock()
+
+    def render(self, key: str, metrics: Dict) -> Future:
+        with self.__lock:
+            if key not in self.__charts:
+                self.__charts[key] = self.__executor.submit(render_loss_chart, metrics)
+            return self.__charts[key]
+
+    def push(self, key: str, metrics: Dict, client_id: str):
+        # the chart goes to the client's clusteringLog once rendered
+        def __push(future: Future):
+            try:
+                image_base64 = base64.b64encode(future.result()).decode()
+            except Exception as e:
+                traceback.print_exc()
+                return
+            socket_worker.push(
+                SocketPayload(
+                    data={
+                        "time": get_current_timestamp(),
+                        "content": image_base64,
+                        "type": "image",
+                    },
+                    channel="clusteringLog",
+                    client_id=client_id,
+                )
+            )
+
+        self.render(key, metrics).add_done_callback(__push)
+
+    def forget(self, key: str):
+        with self.__lock:
+            self.__charts.pop(key, None)
+
+
+chart_worker = ChartWorker()
@@ -0,0 +1,587 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import numpy as np
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from app.core.config import project_config
+from app.core.constant import (
+    ClusteringCriterion,
+    JobStatus,
+    MembershipDtype,
+    ResultFormat,
+)
+from app.core.metric import observe_phase_time
+from app.model.cluster import ClusteringJob
+from app.service.ssmc_fcm import SSMC_FCM
+from app.util.fcm import DistanceMode, PairwiseDistance, SeedingMode
+from app.util.npy import UINT8_SCALE, encode_npy, encode_npz, quantize_membership
+from app.worker.chart import chart_worker
+from app.worker.socket import SocketPayload, socket_worker
+from app.util.time import get_current_timestamp
+
+
+progress_queue = None
+
+
+class QueueSocketWorker:
+    # stands in for socket_worker inside pool processes, payloads are forwarded
+    # to the real socket_worker by the parent process
+    def __init__(self, queue):
+        self.queue = queue
+
+    def push(self, socket_payload):
+        self.queue.put(socket_payload)
+
+
+def init_process(queue):
+    global progress_queue
+    progress_queue = queue
+
+
+def get_socket_worker():
+    return QueueSocketWorker(progress_queue) if progress_queue else socket_worker
+
+
+def format_result(
+    result: Dict,
+    result_format: str = ResultFormat.JSON.value,
+    membership_dtype: str = MembershipDtype.FLOAT32.value,
+    history: Optional[bool] = None,
+):
+    # json: nested lists, with the label history unless history is False
+    # compact: final labels and memberships as base64 .npy, history opt-in
+    # npz: the same arrays as a compressed .npz file (bytes)
+    # chart_id, when given, is the key of the loss chart (see JOB_CHART)
+    result_format = ResultFormat(result_format).value
+    if history is None:
+        history = result_format == ResultFormat.JSON.value
+    pred_labels = result["pred_labels"] if history else result["pred_labels"][-1:]
+    if result_format == ResultFormat.JSON.value:
+        return {
+            **result,
+            "pred_labels": pred_labels,
+            "labels": result["labels"].tolist(),
+            "membership": result["membership"].tolist(),
+            "centroid": result["centroid"].tolist(),
+        }
+    membership_dtype = MembershipDtype(membership_dtype).value
+    membership = quantize_membership(result["membership"], membership_dtype)
+    membership_scale = (
+        UINT8_SCALE if membership_dtype == MembershipDtype.UINT8.value else 1
+    )
+    if result_format == ResultFormat.NPZ.value:
+        return encode_npz(
+            labels=result["labels"].astype(np.int32),
+            membership=membership,
+            membership_scale=membership_scale,
+            centroid=result["centroid"],
+            model=result["model"],
+            pred_labels=pred_labels,
+            identity=result["identity"],
+            phase_time=result["phase_time"],
+            metrics=result["metrics"],
+            **({"chart_id": result["chart_id"]} if result.get("chart_id") else {}),
+        )
+    return {
+        "format": result_format,
+        "pred_labels": pred_labels,
+        "labels": encode_npy(result["labels"].astype(np.int32)),
+        "membership": encode_npy(membership),
+        "membership_scale": membership_scale,
+        "centroid": result["centroid"].tolist(),
+        "identity": result["identity"],
+        "model": result["model"],
+        "phase_time": result["phase_time"],
+        "metrics": result["metrics"],
+        "chart_id": result.get("chart_id"),
+    }
+
+
+def run_clustering(
+    cluster: Dict,
+    client_id: str = None,
+    result_format: str = ResultFormat.JSON.value,
+    membership_dtype: str = MembershipDtype.FLOAT32.value,
+    history: Optional[bool] = None,
+    chart_id: Optional[str] = None,
+):
+    keep_history = (
+        history if history is not None else result_format == ResultFormat.JSON.value
+    )
+    ssmc_fcm = SSMC_FCM(**cluster, keep_history=keep_history)
+    ssmc_fcm.socket_worker = get_socket_worker()
+    ssmc_fcm.clustering(client_id=client_id)
+    # the loss chart is rendered on demand by the parent (see chart_worker)
+    result = format_result(
+        {
+            "pred_labels": ssmc_fcm.pred_labels,
+            "labels": ssmc_fcm.labels,
+            "membership": ssmc_fcm.membership,
+            "centroid": ssmc_fcm.centroid,
+            "identity": list(ssmc_fcm.identity),
+            "model": ssmc_fcm.export_model(),
+            "phase_time": ssmc_fcm.phase_time,
+            "metrics": ssmc_fcm.metric_series(),
+            "chart_id": chart_id,
+        },
+        result_format=result_format,
+        membership_dtype=membership_dtype,
+        history=history,
+    )
+    # phase times and metric series travel next to the result for the parent
+    # process, which owns the prometheus registry and the chart cache
+    return result, {
+        "phase_time": ssmc_fcm.phase_time,
+        "n_points": ssmc_fcm.n_points,
+        "n_clusters": ssmc_fcm.n_clusters,
+        "metrics": ssmc_fcm.metric_series(),
+    }
+
+
+def run_restart(cluster: Dict, seed: int):
+    start_time = time.perf_counter()
+    ssmc_fcm = SSMC_FCM(**{**cluster, "seed": seed})
+    ssmc_fcm.clustering()
+    return {
+        "seed": seed,
+        "loss": float(ssmc_fcm.loss_values[-1]),
+        "davies_bouldin": float(ssmc_fcm.DB_metric[-1]),
+        "aswc": float(ssmc_fcm.ASWC_metric[-1]),
+        "n_loop": len(ssmc_fcm.loss_values),
+        "time": time.perf_counter() - start_time,
+        "phase_time": ssmc_fcm.phase_time,
+        "metrics": ssmc_fcm.metric_series(),
+        "pred_labels": ssmc_fcm.pred_labels,
+        "labels": ssmc_fcm.labels,
+        "membership": ssmc_fcm.membership,
+        "centroid": ssmc_fcm.centroid,
+        "identity": list(ssmc_fcm.identity),
+        "model": ssmc_fcm.export_model(),
+    }
+
+
+def build_pairwise_distance(dataset: List, path: str, block_size: int = 1024):
+    PairwiseDistance(
+        np.array(dataset),
+        mode=DistanceMode.MEMMAP.value,
+        block_size=block_size,
+        path=path,
+    ).matrix
+
+
+def run_sweep(cluster: Dict, n_clusters: int):
+    start_time = time.perf_counter()
+    # labelled clusters are kept, the remaining ones start unsupervised
+    supervised_set = [labelled for labelled in cluster["supervised_set"] if labelled]
+    ssmc_fcm = SSMC_FCM(
+        **{
+            **cluster,
+            "supervised_set": supervised_set
+            + [[] for _ in range(n_clusters - len(supervised_set))],
+        },
+        keep_history=False,
+    )
+    ssmc_fcm.clustering()
+    return {
+        "n_clusters": n_clusters,
+        "loss": float(ssmc_fcm.loss_values[-1]),
+        "davies_bouldin": float(ssmc_fcm.DB_metric[-1]),
+        "aswc": float(ssmc_fcm.ASWC_metric[-1]),
+        "time": time.perf_counter() - start_time,
+        "phase_time": ssmc_fcm.phase_time,
+    }
+
+
+class ClusteringWorker:
+    def __init__(self):
+        print("--- clustering worker has been created")
+        self.__executor = None
+        self.__progress_queue = None
+        self.__pending = set()
+        self.__jobs: Dict[str, ClusteringJob] = {}
+        self.__futures: Dict[str, Future] = {}
+        # chart key -> (stored at, metric series), kept for CLUSTERING_JOB_TTL
+        self.__metrics: Dict[str, Tuple[int, Dict]] = {}
+        self.__lock = threading.Lock()
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        # pool processes are started on first use, not at import time; the
+        # platform default start method (fork on linux) avoids re-importing
+        # the server entrypoint and its models in every process
+        with self.__lock:
+            if self.__executor is None:
+                context = multiprocessing.get_context()
+                self.__progress_queue = context.Queue()
+                self.__pending = set()
+                self.__executor = ProcessPoolExecutor(
+                    max_workers=project_config.CLUSTERING_WORKERS,
+                    mp_context=context,
+                    initializer=init_process,
+                    initargs=(self.__progress_queue,),
+                )
+                progress_thread = threading.Thread(
+                    target=self.__forward, args=(self.__progress_queue,)
+                )
+                progress_thread.daemon = True
+                progress_thread.start()
+        return self.__executor
+
+    def __reset_executor(self, executor: ProcessPoolExecutor):
+        # a pool with a dead process (e.g. killed by the OOM killer) is broken
+        # for good: drop it with its progress forwarder, the next run starts a
+        # fresh one; its pending futures fail and so do their jobs (__finish)
+        with self.__lock:
+            if self.__executor is not executor:
+                return
+            progress_queue = self.__progress_queue
+            pending = list(self.__pending)
+            self.__executor = None
+            self.__progress_queue = None
+            self.__pending = set()
+        print("--- clustering worker pool is broken, restarting it")
+        progress_queue.put(None)
+        # shutdown(cancel_futures=True) needs python 3.9, the image runs 3.8
+        executor.shutdown(wait=False)
+        for future in pending:
+            future.cancel()
+
+    def __forward(self, progress_queue):
+        while True:
+            try:
+                socket_payload = progress_queue.get()
+                if socket_payload is None:
+                    return
+                socket_worker.push(socket_payload)
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                traceback.print_exc()
+
+    def run(self, func: Callable, *args) -> Future:
+        executor = self.__get_executor()
+        try:
+            future = self.__submit(executor, func, *args)
+        except BrokenProcessPool:
+            self.__reset_executor(executor)
+            executor = self.__get_executor()
+            future = self.__submit(executor, func, *args)
+        future.add_done_callback(lambda future: self.__check_executor(executor, future))
+        return future
+
+    def __submit(self, executor: ProcessPoolExecutor, func: Callable, *args):
+        # futures of the current pool are tracked until done, so that a reset
+        # can cancel the ones still queued
+        with self.__lock:
+            pending = self.__pending
+        future = executor.submit(func, *args)
+        pending.add(future)
+        future.add_done_callback(pending.discard)
+        return future
+
+    def __check_executor(self, executor: ProcessPoolExecutor, future: Future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self.__reset_executor(executor)
+
+    def submit(
+        self,
+        cluster: Dict,
+        client_id: str = None,
+        result_format: str = ResultFormat.JSON.value,
+        membership_dtype: str = MembershipDtype.FLOAT32.value,
+        history: Optional[bool] = None,
+        chart: bool = False,
+        checkpoint: bool = False,
+        job_id: Optional[str] = None,
+    ) -> str:
+        # chart: push the loss chart to the client once the job is done
+        # checkpoint: save the run state every CLUSTERING_CHECKPOINT_EVERY loops,
+        # so that resume(job_id) continues it after a failure or a restart
+        self.__clean()
+        job_id = job_id or str(uuid4())
+        if checkpoint:
+            input_path, checkpoint_path = self.__checkpoint_paths(job_id)
+            if not os.path.exists(input_path):
+                os.makedirs(project_config.CLUSTERING_CHECKPOINT_DIR, exist_ok=True)
+                with open(input_path, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {
+                            "cluster": cluster,
+                            "client_id": client_id,
+                            "result_format": result_format,
+                            "membership_dtype": membership_dtype,
+                            "history": history,
+                            "chart": chart,
+                        },
+                        f,
+                    )
+            cluster = {
+                **cluster,
+                "checkpoint_every": project_config.CLUSTERING_CHECKPOINT_EVERY,
+                "checkpoint_path": checkpoint_path,
+            }
+        job = ClusteringJob(
+            id=job_id,
+            status=JobStatus.PENDING,
+            client_id=client_id,
+            created_at=get_current_timestamp(),
+        )
+        future = self.run(
+            run_clustering,
+            cluster,
+            client_id,
+            result_format,
+            membership_dtype,
+            history,
+            job_id,
+        )
+        with self.__lock:
+            self.__jobs[job_id] = job
+            self.__futures[job_id] = future
+        future.add_done_callback(
+            lambda future: self.__finish(
+                job_id, future, chart=chart, checkpoint=checkpoint
+            )
+        )
+        return job_id
+
+    def resume(self, job_id: str) -> Optional[str]:
+        # re-run a checkpointed job from its saved input and last checkpoint
+        job = self.get(job_id)
+        if job and job.status != JobStatus.FAILURE:
+            return job_id
+        input_path, _ = self.__checkpoint_paths(job_id)
+        if not os.path.exists(input_path):
+            return None
+        with open(input_path, encoding="utf-8") as f:
+            job_input = json.load(f)
+        return self.submit(**job_input, checkpoint=True, job_id=job_id)
+
+    def __checkpoint_paths(self, job_id: str):
+        return (
+            os.path.join(project_config.CLUSTERING_CHECKPOINT_DIR, f"{job_id}.json"),
+            os.path.join(project_config.CLUSTERING_CHECKPOINT_DIR, f"{job_id}.npz"),
+        )
+
+    async def wait(self, job_id: str) -> ClusteringJob:
+        future = self.__futures.get(job_id)
+        if future:
+            await asyncio.wait([asyncio.wrap_future(future)])
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[ClusteringJob]:
+        self.__clean()
+        job = self.__jobs.get(job_id)
+        if job and job.status == JobStatus.PENDING and self.__futures[job_id].running():
+            job.status = JobStatus.RUNNING
+        return job
+
+    def get_metrics(self, chart_id: str) -> Optional[Dict]:
+        _, metrics = self.__metrics.get(chart_id, (None, None))
+        return metrics
+
+    def __store_metrics(self, chart_id: str, metrics: Dict):
+        with self.__lock:
+            self.__metrics[chart_id] = (get_current_timestamp(), metrics)
+
+    async def restart(
+        self,
+        cluster: Dict,
+        n_restart: int,
+        criterion: str = ClusteringCriterion.LOSS.value,
+        client_id: str = None,
+        result_format: str = ResultFormat.JSON.value,
+        membership_dtype: str = MembershipDtype.FLOAT32.value,
+    ):
+        # n differently seeded runs in parallel, keeping the one with the lowest
+        # final loss or Davies-Bouldin score
+        cluster = {"seeding": SeedingMode.KMEANS_PP.value, **cluster}
+        seeds = np.random.default_rng(cluster.pop("seed", None)).integers(
+            0, 2**31, size=n_restart
+        )
+        futures = [
+            asyncio.wrap_future(self.run(run_restart, cluster, int(seed)))
+            for seed in seeds
+        ]
+        runs: List[Dict] = []
+        for future in asyncio.as_completed(futures):
+            run = await future
+            runs.append(run)
+            observe_phase_time(
+                run["phase_time"], len(cluster["dataset"]), len(run["centroid"])
+            )
+            if client_id:
+                socket_worker.push(
+                    SocketPayload(
+                        data={
+                            "time": get_current_timestamp(),
+                            "content": f"Hoàn tất lần chạy {len(runs)}/{n_restart} (seed {run['seed']}): {criterion} = {run[criterion]:.4f}, {run['time']:.2f}s",
+                        },
+                        channel="clusteringLog",
+                        client_id=client_id,
+                    )
+                )
+        runs.sort(key=lambda run: run["seed"])
+        best_run = min(range(len(runs)), key=lambda idx: runs[idx][criterion])
+        # the best run's chart is kept like a job's, under its own key
+        chart_id = str(uuid4())
+        self.__store_metrics(chart_id, runs[best_run]["metrics"])
+        result_keys = (
+            "pred_labels",
+            "labels",
+            "membership",
+            "centroid",
+            "identity",
+            "model",
+            "metrics",
+        )
+        result = format_result(
+            {
+                **{key: runs[best_run][key] for key in result_keys},
+                "phase_time": runs[best_run]["phase_time"],
+                "chart_id": chart_id,
+            },
+            result_format=result_format,
+            membership_dtype=membership_dtype,
+        )
+        if isinstance(result, bytes):
+            return result
+        return {
+            **result,
+            "best_run": best_run,
+            "runs": [
+                {key: value for key, value in run.items() if key not in result_keys}
+                for run in runs
+            ],
+        }
+
+    async def sweep(
+        self, cluster: Dict, k_min: int, k_max: int, client_id: str = None
+    ) -> Dict:
+        # one run per number of clusters in parallel, the k-independent pairwise
+        # distance matrix is built once into a memmap file shared by every run
+        n_supervised = len(
+            [labelled for labelled in cluster["supervised_set"] if labelled]
+        )
+        n_clusters = list(range(max(k_min, n_supervised, 2), k_max + 1))
+        distance_dir = tempfile.mkdtemp(prefix="algo-sweep-")
+        cluster = {
+            **cluster,
+            "distance_mode": DistanceMode.MEMMAP.value,
+            "distance_path": os.path.join(distance_dir, "distance.npy"),
+        }
+        try:
+            await asyncio.wrap_future(
+                self.run(
+                    build_pairwise_distance,
+                    cluster["dataset"],
+                    cluster["distance_path"],
+                )
+            )
+            futures = [
+                asyncio.wrap_future(self.run(run_sweep, cluster, k)) for k in n_clusters
+            ]
+            runs: List[Dict] = []
+            for future in asyncio.as_completed(futures):
+                run = await future
+                runs.append(run)
+                observe_phase_time(
+                    run["phase_time"], len(cluster["dataset"]), run["n_clusters"]
+                )
+                if client_id:
+                    socket_worker.push(
+                        SocketPayload(
+                            data={
+                                "time": get_current_timestamp(),
+                                "content": f"Hoàn tất phân cụm với k = {run['n_clusters']}: DB = {run['davies_bouldin']:.4f}, ASWC = {run['aswc']:.4f}, {run['time']:.2f}s",
+                            },
+                            channel="clusteringLog",
+                            client_id=client_id,
+                        )
+                    )
+        finally:
+            shutil.rmtree(distance_dir, ignore_errors=True)
+        runs.sort(key=lambda run: run["n_clusters"])
+        # lowest Davies-Bouldin wins, ties broken by the highest ASWC
+        recommended = min(
+            runs,
+            key=lambda run: (run["davies_bouldin"], -run["aswc"]),
+            default={"n_clusters": None},
+        )
+        return {
+            "n_clusters": [run["n_clusters"] for run in runs],
+            "loss": [run["loss"] for run in runs],
+            "davies_bouldin": [run["davies_bouldin"] for run in runs],
+            "aswc": [run["aswc"] for run in runs],
+            "time": [run["time"] for run in runs],
+            "phase_time": [run["phase_time"] for run in runs],
+            "recommended_n_clusters": recommended["n_clusters"],
+        }
+
+    def __finish(
+        self,
+        job_id: str,
+        future: Future,
+        chart: bool = False,
+        checkpoint: bool = False,
+    ):
+        job = self.__jobs[job_id]
+        job.finished_at = get_current_timestamp()
+        try:
+            job.result, run_info = future.result()
+            self.__store_metrics(job_id, run_info["metrics"])
+            job.status = JobStatus.SUCCESS
+            observe_phase_time(
+                run_info["phase_time"], run_info["n_points"], run_info["n_clusters"]
+            )
+            if chart and job.client_id:
+                chart_worker.push(job_id, run_info["metrics"], job.client_id)
+            # a finished job no longer needs its checkpoint
+            if checkpoint:
+                for path in self.__checkpoint_paths(job_id):
+                    if os.path.exists(path):
+                        os.remove(path)
+        except (Exception, CancelledError) as e:
+            traceback.print_exc()
+            job.error = str(e) or e.__class__.__name__
+            job.status = JobStatus.FAILURE
+        self.__clean()
+
+    def forget(self, job_id: str, keep_chart: bool = False):
+        # drop a job with its result, e.g. once a synchronous call returned it;
+        # keep_chart leaves its (small) metric series to JOB_CHART until expiry
+        with self.__lock:
+            self.__jobs.pop(job_id, None)
+            self.__futures.pop(job_id, None)
+            if not keep_chart:
+                self.__metrics.pop(job_id, None)
+        if not keep_chart:
+            chart_worker.forget(job_id)
+
+    def __clean(self):
+        # forget finished jobs and charts older than CLUSTERING_JOB_TTL
+        expired_at = get_current_timestamp() - project_config.CLUSTERING_JOB_TTL
+        with self.__lock:
+            expired = [
+                job_id
+                for job_id, job in self.__jobs.items()
+                if job.finished_at and job.finished_at < expired_at
+            ] + [
+                chart_id
+                for chart_id, (stored_at, _) in self.__metrics.items()
+                if stored_at < expired_at and chart_id not in self.__jobs
+            ]
+        for job_id in expired:
+            self.forget(job_id)
+
+
+clustering_worker = ClusteringWorker()
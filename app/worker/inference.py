@@ -0,0 +1,48 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import status
+from typing import Callable
+
+from app.core.config import project_config
+from app.core.exception import CustomHTTPException
+
+
+class InferenceWorker:
+    # runs blocking vectorization (underthesea, gensim, torch) off the event
+    # loop: INFERENCE_WORKERS threads, at most INFERENCE_QUEUE_SIZE calls
+    # running or waiting, further calls are rejected with inference_busy
+    def __init__(self):
+        print("--- inference worker has been created")
+        self.__executor = ThreadPoolExecutor(
+            max_workers=project_config.INFERENCE_WORKERS,
+            thread_name_prefix="inference-worker",
+            initializer=self.__init_thread,
+        )
+        self.__slots = threading.BoundedSemaphore(
+            max(project_config.INFERENCE_QUEUE_SIZE, project_config.INFERENCE_WORKERS)
+        )
+
+    def __init_thread(self):
+        # torch intra-op threads are process wide, 0 keeps torch's default
+        if project_config.INFERENCE_TORCH_THREADS:
+            import torch
+
+            torch.set_num_threads(project_config.INFERENCE_TORCH_THREADS)
+
+    async def run(self, func: Callable, *args, **kwargs):
+        if not self.__slots.acquire(blocking=False):
+            raise CustomHTTPException(
+                error_type="inference_busy",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        try:
+            future = self.__executor.submit(func, *args, **kwargs)
+        except Exception:
+            self.__slots.release()
+            raise
+        future.add_done_callback(lambda future: self.__slots.release())
+        return await asyncio.wrap_future(future)
+
+
+inference_worker = InferenceWorker()
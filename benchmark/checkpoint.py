@@ -0,0 +1,76 @@
+import argparse
+import os
+import tempfile
+import numpy as np
+
+from app.service.ssmc_fcm import SSMC_FCM
+from benchmark.clustering import make_dataset
+
+DATASET = dict(n_points=600, n_dims=10, n_fields=3, n_clusters=4, supervised_ratio=0.02)
+
+# interrupted: stop after `stop_loop` loops, or crash in the final metrics of
+# the last loop (checkpoint written on the last loop, nothing left to iterate)
+CASES = [
+    dict(params=dict(), stop_loop=7),
+    dict(params=dict(patience=2, metric_every=3), stop_loop=7),
+    dict(params=dict(batch_size=100, seeding="kmeans++"), stop_loop=7),
+    dict(params=dict(metric_every=0, n_loop=4), stop_loop=None),
+    dict(params=dict(metric_every=3, n_loop=6), stop_loop=None),
+    dict(params=dict(batch_size=100, n_loop=4, metric_every=0), stop_loop=None),
+]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CrashingSSMC_FCM(SSMC_FCM):
+    # fails in the final ASWC, after the last checkpoint has been written
+    def _SSMC_FCM__calculate_ASWC(self):
+        raise Interrupted()
+
+
+def run_case(params, stop_loop, seed=0, checkpoint_every=2):
+    cluster = {**make_dataset(**DATASET, seed=seed), "seed": seed, **params}
+    expected = SSMC_FCM(**cluster)
+    expected.clustering()
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        checkpoint = dict(
+            checkpoint_every=checkpoint_every,
+            checkpoint_path=os.path.join(checkpoint_dir, "checkpoint.npz"),
+        )
+        if stop_loop:
+            SSMC_FCM(**{**cluster, "n_loop": stop_loop}, **checkpoint).clustering()
+        else:
+            try:
+                CrashingSSMC_FCM(**cluster, **checkpoint).clustering()
+            except Interrupted:
+                pass
+        resumed = SSMC_FCM(**cluster, **checkpoint)
+        resumed.clustering()
+    return {
+        "membership": float(np.max(np.abs(expected.membership - resumed.membership))),
+        "loss": expected.loss_values == resumed.loss_values,
+        "davies_bouldin": expected.DB_metric == resumed.DB_metric,
+        "aswc": expected.ASWC_metric == resumed.ASWC_metric,
+        "pred_labels": expected.pred_labels == resumed.pred_labels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSMC_FCM checkpoint resume check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failed = 0
+    for case in CASES:
+        result = run_case(**case, seed=args.seed)
+        passed = result.pop("membership") == 0 and all(result.values())
+        failed += not passed
+        print(f"{str(case):<80} {'ok' if passed else 'MISMATCH ' + str(result)}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
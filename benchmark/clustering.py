@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import numpy as np
+
+from app.service.ssmc_fcm import SSMC_FCM
+
+REPORT_DIR = os.path.join(os.path.dirname(__file__), "report")
+BASELINE_PATH = os.path.join(REPORT_DIR, "clustering_baseline.json")
+
+# n points, d dimensions split into f fields, k clusters, supervised ratio
+CASES = {
+    "small": [
+        dict(n_points=500, n_dims=8, n_fields=2, n_clusters=4, supervised_ratio=0.05),
+        dict(n_points=2000, n_dims=16, n_fields=4, n_clusters=5, supervised_ratio=0.05),
+    ],
+    "default": [
+        dict(n_points=1000, n_dims=8, n_fields=2, n_clusters=4, supervised_ratio=0.05),
+        dict(n_points=5000, n_dims=32, n_fields=4, n_clusters=5, supervised_ratio=0.05),
+        dict(n_points=5000, n_dims=32, n_fields=4, n_clusters=10, supervised_ratio=0.0),
+        dict(n_points=5000, n_dims=128, n_fields=8, n_clusters=5, supervised_ratio=0.1),
+        dict(
+            n_points=20000, n_dims=32, n_fields=4, n_clusters=8, supervised_ratio=0.02
+        ),
+    ],
+}
+
+
+def case_name(case):
+    return "n{n_points}-d{n_dims}-f{n_fields}-k{n_clusters}-s{supervised_ratio}".format(
+        **case
+    )
+
+
+def make_dataset(
+    n_points, n_dims, n_fields, n_clusters, supervised_ratio, seed=0, spread=4.0
+):
+    # gaussian blobs around random centers, the first supervised_ratio of each
+    # blob is labelled; d is split into n_fields near-equal fields
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, n_dims)) * spread
+    labels = rng.integers(0, n_clusters, n_points)
+    dataset = centers[labels] + rng.normal(size=(n_points, n_dims))
+    fields_len = [len(field) for field in np.array_split(range(n_dims), n_fields)]
+    supervised_set = [
+        np.flatnonzero(labels == id_cluster)[
+            : int(supervised_ratio * np.sum(labels == id_cluster))
+        ].tolist()
+        for id_cluster in range(n_clusters)
+    ]
+    return {
+        "dataset": dataset,
+        "fields_len": fields_len,
+        "fields_weight": [1] * n_fields,
+        "supervised_set": supervised_set,
+    }
+
+
+def run_case(case, repeat=1, seed=0, **params):
+    # timed repeats run untraced (tracemalloc slows python code down several
+    # times), the peak memory comes from one more, traced, run
+    cluster = make_dataset(**case, seed=seed)
+    runs = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        ssmc_fcm = SSMC_FCM(**cluster, seed=seed, **params)
+        ssmc_fcm.clustering()
+        wall_time = time.perf_counter() - start_time
+        runs.append(
+            {
+                "wall_time": wall_time,
+                "n_loop": len(ssmc_fcm.loss_values),
+                "loss": ssmc_fcm.loss_values[-1],
+                "phase_time": ssmc_fcm.phase_time,
+            }
+        )
+    tracemalloc.start()
+    SSMC_FCM(**cluster, seed=seed, **params).clustering()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the fastest repeat is the least disturbed one
+    best = min(runs, key=lambda run: run["wall_time"])
+    return {"name": case_name(case), **case, **best, "peak_memory": peak_memory}
+
+
+def compare(results, baseline, tolerance):
+    # wall time ratio against the baseline case of the same name
+    baseline = {case["name"]: case for case in baseline["cases"]}
+    comparison = []
+    for case in results:
+        if case["name"] not in baseline:
+            continue
+        ratio = case["wall_time"] / baseline[case["name"]]["wall_time"]
+        comparison.append(
+            {
+                "name": case["name"],
+                "wall_time_ratio": ratio,
+                "peak_memory_ratio": case["peak_memory"]
+                / baseline[case["name"]]["peak_memory"],
+                "is_regression": ratio > 1 + tolerance,
+            }
+        )
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSMC_FCM benchmark")
+    parser.add_argument("--cases", choices=CASES.keys(), default="default")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--params", default="{}", help="json of SSMC_FCM kwargs")
+    parser.add_argument("--output", help="report path, default benchmark/report/")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = []
+    for case in CASES[args.cases]:
+        result = run_case(
+            case, repeat=args.repeat, seed=args.seed, **json.loads(args.params)
+        )
+        results.append(result)
+        print(
+            f"{result['name']:<36} {result['wall_time']:8.3f}s "
+            f"{result['peak_memory'] / 2**20:8.1f}MiB loops={result['n_loop']}"
+        )
+
+    report = {
+        "created_at": time.time(),
+        "params": json.loads(args.params),
+        "cases": results,
+    }
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(results, json.load(f), args.tolerance)
+        for case in report["comparison"]:
+            print(
+                f"{case['name']:<36} x{case['wall_time_ratio']:.2f} time "
+                f"x{case['peak_memory_ratio']:.2f} memory"
+                + (" REGRESSION" if case["is_regression"] else "")
+            )
+    elif not args.save_baseline:
+        # baselines are machine specific, none is committed
+        print(f"no baseline at {args.baseline}, create one with --save-baseline")
+
+    output = (
+        args.baseline
+        if args.save_baseline
+        else args.output
+        or os.path.join(REPORT_DIR, f"clustering_{report['created_at']}.json")
+    )
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"report: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import math
+import time
+import numpy as np
+
+from app.util.fcm import fuzzy_membership
+
+
+def loop_membership(Dij, fuzzi_M):
+    fuzzi_M_pow = 1 / (fuzzi_M - 1)
+    membership = []
+    for id_point in range(len(Dij)):
+        Dij_pow = []
+        sum_Dij_pow = 0
+        for id_centroid in range(len(Dij[id_point])):
+            Dik_pow = math.pow(Dij[id_point][id_centroid], fuzzi_M_pow)
+            Dij_pow.append(Dik_pow)
+            sum_Dij_pow += 1 / Dik_pow
+        membership.append([1 / (Dik_pow * sum_Dij_pow) for Dik_pow in Dij_pow])
+    return membership
+
+
+def run(n_points, n_clusters, fuzzi_M=2, repeat=5):
+    Dij = np.random.default_rng(0).random((n_points, n_clusters)) + 0.001
+    Dij_list = Dij.tolist()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        expected = loop_membership(Dij_list, fuzzi_M)
+    loop_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        actual = fuzzy_membership(Dij, fuzzi_M)
+    vector_time = (time.perf_counter() - start) / repeat
+
+    assert np.allclose(expected, actual, rtol=1e-10, atol=1e-12)
+    print(
+        f"n={n_points:<6} k={n_clusters:<3} loop={loop_time * 1000:9.2f}ms "
+        f"numpy={vector_time * 1000:7.2f}ms speedup={loop_time / vector_time:6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    for n_points, n_clusters in [(1000, 5), (5000, 10), (20000, 10)]:
+        run(n_points, n_clusters)
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from app.core.constant import InferenceMode
+from app.service.loader import Loader
+
+REPORT_DIR = os.path.join(os.path.dirname(__file__), "report")
+
+SAMPLE = [
+    "Em muốn tham gia câu lạc bộ để học hỏi thêm kỹ năng lập trình",
+    "Mình thích thiết kế đồ họa và chụp ảnh sự kiện",
+    "Tôi có kinh nghiệm tổ chức sự kiện ở trường cấp ba",
+    "Em muốn rèn luyện kỹ năng giao tiếp và làm việc nhóm",
+    "Mình đã từng làm truyền thông cho một câu lạc bộ tình nguyện",
+    "Em yêu thích trí tuệ nhân tạo và học máy",
+    "Tôi muốn kết bạn với nhiều người có cùng đam mê",
+    "Em có thể dành ba buổi mỗi tuần cho hoạt động của câu lạc bộ",
+    "Mình biết sử dụng Photoshop, Premiere và Canva",
+    "Em muốn phát triển bản thân và đóng góp cho cộng đồng",
+]
+
+
+def embed(loader, data, batch_size, repeat):
+    # best of `repeat` timed runs, after a warm-up run that also loads the model
+    features = loader.feature_engineering(data, batch_size=batch_size, use_cache=False)
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        loader.feature_engineering(data, batch_size=batch_size, use_cache=False)
+        times.append(time.perf_counter() - start_time)
+    return features, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 vs fp32 PhoBERT embeddings")
+    parser.add_argument("--input", help="text file, one sample per line")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--output", help="report path, default benchmark/report/")
+    args = parser.parse_args()
+
+    data = SAMPLE
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            data = [line.strip() for line in f if line.strip()]
+
+    fp32, fp32_time = embed(
+        Loader(InferenceMode.FP32.value), data, args.batch_size, args.repeat
+    )
+    int8, int8_time = embed(
+        Loader(InferenceMode.INT8.value), data, args.batch_size, args.repeat
+    )
+    cosine = np.sum(fp32 * int8, axis=1) / (
+        np.linalg.norm(fp32, axis=1) * np.linalg.norm(int8, axis=1)
+    )
+    report = {
+        "created_at": time.time(),
+        "n_samples": len(data),
+        "fp32_time": fp32_time,
+        "int8_time": int8_time,
+        "speedup": fp32_time / int8_time,
+        "cosine_mean": float(np.mean(cosine)),
+        "cosine_min": float(np.min(cosine)),
+        "max_abs_error": float(np.max(np.abs(fp32 - int8))),
+        "passed": bool(np.min(cosine) >= args.min_cosine),
+    }
+    print(json.dumps(report, indent=2))
+    output = args.output or os.path.join(
+        REPORT_DIR, f"quantization_{report['created_at']}.json"
+    )
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"report: {output}")
+    if not report["passed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()